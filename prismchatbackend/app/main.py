@@ -74,8 +74,9 @@ async def upload(files: List[UploadFile] = File(...), route: str = "default"):
                 b64 = data.get("redacted_image_b64")
                 if not b64:
                     raise HTTPException(status_code=502, detail="Gateway returned no redacted image")
-                png_bytes = base64.b64decode(b64)
-                url = upload_image_bytes(f"redacted-{f.filename or 'image'}.png", png_bytes, "image/png")
+                media_type = data.get("media_type", "image/png")
+                ext = {"image/jpeg": "jpg", "image/webp": "webp"}.get(media_type, "png")
+                url = upload_image_bytes(f"redacted-{f.filename or 'image'}.{ext}", base64.b64decode(b64), media_type)
                 urls.append(url)
         else:
             for f in files:
@@ -1,109 +1,553 @@
 # prismguard_llm/app.py
-import os, time
-from typing import List, Dict, Any, Literal
+import os, re, time, json, codecs, queue, asyncio, hashlib, threading
+import multiprocessing as mp
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Literal, Tuple, Optional, AsyncIterator
 
+import numpy as np
 import torch
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from transformers import AutoTokenizer, AutoModelForTokenClassification
+from transformers import AutoTokenizer
+
+from cache import RedactionCache
+from engines import load_engine
+from detectors import detect, prescreen
+from postprocess import token_spans, merge_spans, redact
 
 # --- config
 MODEL_DIR = os.getenv("MODEL_DIR", "/app/model")  
 MAX_LEN = int(os.getenv("MAX_LEN", "128"))
+# inference backend: torch | torch-int8 | onnx | onnx-int8 (ONNX exports are cached in ENGINE_CACHE_DIR)
+INFER_ENGINE = os.getenv("INFER_ENGINE", "torch")
+ENGINE_CACHE_DIR = os.getenv("ENGINE_CACHE_DIR", os.path.join(MODEL_DIR, "onnx"))
+# INFER_WORKERS > 1 forks that many inference processes sharing the loaded weights
+INFER_WORKERS = int(os.getenv("INFER_WORKERS", "1"))
+# micro-batching: wait up to BATCH_WINDOW_MS for up to BATCH_MAX_SIZE concurrent requests
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "5"))
+# longest a request waits for its model pass before answering 504
+INFER_TIMEOUT_S = float(os.getenv("INFER_TIMEOUT_S", "30"))
+# long inputs: "window" splits into MAX_LEN windows overlapping by WINDOW_STRIDE tokens,
+# "truncate" keeps the old behaviour (everything past MAX_LEN tokens is not redacted)
+LONG_TEXT_MODE = os.getenv("LONG_TEXT_MODE", "window")
+WINDOW_STRIDE = int(os.getenv("WINDOW_STRIDE", "32"))
+# cap on rows per forward pass so very long documents don't blow up activation memory
+MAX_ROWS_PER_PASS = int(os.getenv("MAX_ROWS_PER_PASS", "64"))
+# bulk endpoint: items are length-sorted into buckets of BULK_BUCKET_SIZE per forward pass
+BULK_BUCKET_SIZE = int(os.getenv("BULK_BUCKET_SIZE", "32"))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+# streaming endpoint: segments of STREAM_SEGMENT_CHARS..2x that, cut on sentence/whitespace boundaries,
+# at most STREAM_INFLIGHT segments queued for inference at once
+STREAM_SEGMENT_CHARS = int(os.getenv("STREAM_SEGMENT_CHARS", "2000"))
+STREAM_INFLIGHT = int(os.getenv("STREAM_INFLIGHT", "4"))
+# tiered pipeline: deterministic detectors always run; in "smart" mode the model is skipped
+# for inputs the pre-screen deems PII-free (pure code blocks, short stop-word-only turns)
+PRESCREEN = os.getenv("PRESCREEN", "1").lower() not in ("0", "false", "off", "")
+PRESCREEN_MAX_CHARS = int(os.getenv("PRESCREEN_MAX_CHARS", "64"))
+# warm-up before /ready: one pass per (batch size, token length) so allocators and kernels are hot
+WARMUP = os.getenv("WARMUP", "1").lower() not in ("0", "false", "off", "")
+WARMUP_LENGTHS = [int(x) for x in os.getenv("WARMUP_LENGTHS", f"16,64,{MAX_LEN}").split(",") if x.strip()]
+# redaction cache (digest -> spans); CACHE_MAX_ENTRIES=0 disables it, CACHE_TTL_S=0 means no expiry
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "50000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+CACHE_TTL_S = float(os.getenv("CACHE_TTL_S", "0"))
 
 DEVICE = "cpu"
 os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
 torch.set_num_threads(int(os.getenv("TORCH_NUM_THREADS", "1")))
 
-# 
-try:
-    tok = AutoTokenizer.from_pretrained(MODEL_DIR, use_fast=True, local_files_only=True)
-    model = AutoModelForTokenClassification.from_pretrained(MODEL_DIR, local_files_only=True).to(DEVICE)
-    model.eval()
-    ID2LABEL = model.config.id2label
-except Exception as e:
-    raise RuntimeError(f"Failed to load model from {MODEL_DIR}: {e}")
+def _model_revision() -> str:
+    """
+    Cache namespace: anything that can change the spans for a given input.
+    MODEL_REVISION overrides the digest of the model config + inference/pre-screen settings.
+    """
+    if os.getenv("MODEL_REVISION"):
+        return os.environ["MODEL_REVISION"]
+    h = hashlib.sha256()
+    with open(os.path.join(MODEL_DIR, "config.json"), "rb") as f:
+        h.update(f.read())
+    h.update(json.dumps([INFER_ENGINE, MAX_LEN, LONG_TEXT_MODE, WINDOW_STRIDE, PRESCREEN, PRESCREEN_MAX_CHARS]).encode())
+    return h.hexdigest()[:16]
+
+_cache = RedactionCache(_model_revision(), CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL_S)
+
+# Model state is filled in by _load() on a background thread at startup (see _lifespan);
+# inference endpoints answer 503 until _state["ready"].
+tok = engine = IS_PII = None
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_batcher: Optional["_MicroBatcher"] = None
+_state: Dict[str, Any] = {"ready": False, "phase": "starting", "error": None, "started_at": time.time()}
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    threading.Thread(target=_load, name="pg-loader", daemon=True).start()
+    yield
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
 
-app = FastAPI(title="PrismGuard LLM (Text Anonymizer)", version="0.1.0")
+app = FastAPI(title="PrismGuard LLM (Text Anonymizer)", version="0.1.0", lifespan=_lifespan)
 
 class TextReq(BaseModel):
     text: str
     mode: Literal["smart", "strict"] = "smart" 
 
+class BatchReq(BaseModel):
+    items: List[TextReq]
+
+def _predict_batch(texts: List[str]) -> List[Dict[str, Any]]:
+    """
+    Run token classification for several texts in one padded forward pass.
+    In "window" mode each text longer than MAX_LEN tokens becomes several overlapping
+    rows of the same batch; rows are mapped back to their text via the tokenizer's
+    overflow_to_sample_mapping. Returns one {redacted_text, entities} dict per input, in order.
+    """
+    windowed = LONG_TEXT_MODE == "window"
+    enc = tok(
+        texts,
+        return_offsets_mapping=True,
+        truncation=True,
+        max_length=MAX_LEN,
+        stride=WINDOW_STRIDE if windowed else 0,
+        return_overflowing_tokens=windowed,
+        padding=True,
+        return_tensors="np",
+    )
+    offsets = enc.pop("offset_mapping")
+    if windowed:
+        sample_map = enc.pop("overflow_to_sample_mapping")
+    else:
+        sample_map = np.arange(len(texts))
+    feeds = dict(enc)
+    n_rows = len(offsets)
+    step = max(1, MAX_ROWS_PER_PASS)
+    pred_ids = np.empty(offsets.shape[:2], dtype=np.int64)
+    for r in range(0, n_rows, step):
+        logits = engine({k: v[r:r + step] for k, v in feeds.items()})  # (rows, seq_len, num_labels)
+        pred_ids[r:r + step] = logits.argmax(-1)
+
+    out = []
+    for i, text in enumerate(texts):
+        rows = sample_map == i
+        spans = token_spans(offsets[rows], pred_ids[rows], IS_PII, len(text))
+        out.append(redact(text, spans.tolist()))
+    return out
+
 def _predict(text: str) -> Dict[str, Any]:
     """
-    Run token classification → char-level mask → redact to [REDACTED].
+    Run token classification → merged token spans → redact to [REDACTED].
     Returns redacted_text and simple spans (start,end,label).
     """
-    with torch.inference_mode():
-        enc = tok(
-            text,
-            return_offsets_mapping=True,
-            truncation=True,
-            max_length=MAX_LEN,
-            return_tensors="pt",
-        )
-        offsets = enc.pop("offset_mapping")[0].tolist()  # keep on CPU
-        enc = {k: v.to(DEVICE) for k, v in enc.items()}
-        logits = model(**enc).logits  # (1, seq_len, num_labels)
-        pred_ids = logits.argmax(-1)[0].tolist()
-
-    n_chars = len(text)
-
-    # Build char-level mask
-    char_mask = [0] * n_chars
-    for (a, b), lab_id in zip(offsets, pred_ids):
-        # specials like [CLS]/[SEP] usually have (0,0) or b==0
-        if a is None or b is None or b == 0:
+    return _predict_batch([text])[0]
+
+def _screen(text: str, mode: str) -> Tuple[List[Tuple[int, int, str]], bool]:
+    """
+    First tier: detector spans, and whether the model still has to run.
+    "strict" always runs the model (with broader detectors); "smart" skips it when
+    nothing was detected and the pre-screen deems the text PII-free.
+    """
+    strict = mode == "strict"
+    det = detect(text, strict=strict)
+    if not text.strip():
+        return det, False
+    skip = not strict and not det and PRESCREEN and prescreen(text, PRESCREEN_MAX_CHARS)
+    return det, not skip
+
+def _combine(text: str, det: List[Tuple[int, int, str]], model_out: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    model_spans = [(e["start"], e["end"]) for e in model_out["entities"]] if model_out else []
+    return redact(text, merge_spans(det, model_spans))
+
+def _predict_bulk(texts: List[str], modes: List[str]) -> List[Dict[str, Any]]:
+    """
+    Answer cached and pre-screened texts directly, sort the rest by length into buckets
+    of BULK_BUCKET_SIZE so each padded forward pass holds similar lengths, then restore
+    the original order. Each item's timing_ms is its share of its bucket's wall time.
+    """
+    results: List[Dict[str, Any]] = [{} for _ in texts]
+    keys = [_cache.key(t, m) for t, m in zip(texts, modes)]
+    dets: Dict[int, List[Tuple[int, int, str]]] = {}
+    misses = []
+    for i, (text, mode, key) in enumerate(zip(texts, modes, keys)):
+        t0 = time.time()
+        spans = _cache.get(key)
+        if spans is not None:
+            results[i] = {**redact(text, spans), "timing_ms": (time.time() - t0) * 1000.0}
             continue
-        label = ID2LABEL[int(lab_id)]
-        if label != "O":
-            aa = max(0, min(a, n_chars))
-            bb = max(aa, min(b, n_chars))
-            for i in range(aa, bb):
-                char_mask[i] = 1
-
-    # Merge contiguous 1s into spans
-    spans: List[List[int]] = []
-    i = 0
-    while i < n_chars:
-        if char_mask[i] == 1:
-            j = i + 1
-            while j < n_chars and char_mask[j] == 1:
-                j += 1
-            spans.append([i, j])
-            i = j
+        dets[i], needs_model = _screen(text, mode)
+        if needs_model:
+            misses.append(i)
         else:
-            i += 1
+            out = _combine(text, dets[i], None)
+            _cache.put(key, out["entities"])
+            results[i] = {**out, "timing_ms": (time.time() - t0) * 1000.0}
+
+    order = sorted(misses, key=lambda i: len(texts[i]))
+    step = max(1, BULK_BUCKET_SIZE)
+    buckets = [order[b:b + step] for b in range(0, len(order), step)]
+    futs = [_run_batch([texts[i] for i in idx]) for idx in buckets]  # spread over workers
+    for idx, fut in zip(buckets, futs):
+        outs, elapsed_ms = fut.result()
+        per_item_ms = elapsed_ms / len(idx)
+        for i, model_out in zip(idx, outs):
+            out = _combine(texts[i], dets[i], model_out)
+            _cache.put(keys[i], out["entities"])
+            out["timing_ms"] = per_item_ms
+            results[i] = out
+    return results
+
+_SENTENCE_END = re.compile(r"[.!?\n]+[\s\"')\]]*\s")
+
+def _next_segment(buf: str, target: int, final: bool) -> Optional[int]:
+    """
+    Where to cut the next streamed segment out of buf, or None to wait for more input.
+    Prefers the last sentence end past target/2 within 2*target chars, then the last
+    whitespace, so entities are never split across segments in practice.
+    """
+    if final:
+        return len(buf) or None
+    limit = 2 * target
+    if len(buf) < target:
+        return None
+    window = buf[:limit]
+    cut = None
+    for m in _SENTENCE_END.finditer(window, target // 2):
+        cut = m.end()
+    if cut is None and len(buf) >= limit:
+        ws = window.rfind(" ", target // 2)
+        cut = ws + 1 if ws >= 0 else limit
+    return cut
+
+# --- worker pool
+def _timed_predict_batch(texts: List[str]) -> Tuple[List[Dict[str, Any]], float]:
+    t0 = time.time()
+    outs = _predict_batch(texts)
+    return outs, (time.time() - t0) * 1000.0
+
+def _worker_init():
+    torch.set_num_threads(int(os.getenv("TORCH_NUM_THREADS", "1")))
+
+def _start_pool(n_workers: int) -> Optional[ProcessPoolExecutor]:
+    """
+    Fork n_workers inference processes after the model is loaded. Torch weights are
+    moved to shared memory first, so every worker maps the same pages and RSS doesn't
+    grow with the worker count. Workers are forked up front, before the batcher starts
+    and before anything has run inference in this process.
+    """
+    if n_workers <= 1:
+        return None
+    engine.share_memory()
+    pool = ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context("fork"), initializer=_worker_init)
+    for f in [pool.submit(os.getpid) for _ in range(n_workers)]:
+        f.result()
+    return pool
+
+def _restart_pool(broken: ProcessPoolExecutor):
+    """
+    Replace a pool that lost a worker (OOM kill, SIGKILL). Inference answers 503 while the
+    workers are re-forked; if that fails the service reports failed so /live gets it restarted.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not broken:
+            return  # another failed batch already replaced it
+        _state.update(ready=False, phase="restarting_workers")
+        broken.shutdown(wait=False, cancel_futures=True)
+        try:
+            _pool = _start_pool(INFER_WORKERS)
+        except Exception as e:
+            _state.update(phase="failed", error=f"Inference workers died and could not be restarted: {e}")
+            return
+        _state["worker_restarts"] = _state.get("worker_restarts", 0) + 1
+        _state.update(phase="ready", ready=True)
+
+def _check_pool(pool: ProcessPoolExecutor, fut: Future):
+    if not fut.cancelled() and isinstance(fut.exception(), BrokenProcessPool):
+        # not on this thread: it is the pool's own management thread
+        threading.Thread(target=_restart_pool, args=(pool,), name="pg-pool-restart", daemon=True).start()
+
+def _run_batch(texts: List[str]) -> Future:
+    """
+    Run _predict_batch on a pool worker, or inline when there is no pool.
+    The future resolves to (results, elapsed_ms); a dead worker fails it with
+    BrokenProcessPool and triggers a pool restart.
+    """
+    pool = _pool
+    if pool is not None:
+        try:
+            fut = pool.submit(_timed_predict_batch, texts)
+        except BrokenProcessPool as e:
+            fut = Future()
+            fut.set_exception(e)
+        fut.add_done_callback(lambda f: _check_pool(pool, f))
+        return fut
+    fut: Future = Future()
+    try:
+        fut.set_result(_timed_predict_batch(texts))
+    except Exception as e:
+        fut.set_exception(e)
+    return fut
+
+class _MicroBatcher:
+    """
+    Collects concurrent requests for up to BATCH_WINDOW_MS (or BATCH_MAX_SIZE items)
+    and runs them through _predict_batch as one forward pass. With a worker pool, up to
+    one batch per worker is in flight while the next one is being collected.
+    """
+
+    def __init__(self, max_size: int, window_ms: float, max_inflight: int = 1):
+        self.max_size = max(1, max_size)
+        self.window_s = max(0.0, window_ms) / 1000.0
+        self._slots = threading.Semaphore(max(1, max_inflight))
+        self._q: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="pg-batcher", daemon=True)
+        self._thread.start()
 
-    # Redact
-    redacted_parts = []
-    last = 0
-    for a, b in spans:
-        if a > last:
-            redacted_parts.append(text[last:a])
-        redacted_parts.append("[REDACTED]")
-        last = b
-    if last < n_chars:
-        redacted_parts.append(text[last:])
-    redacted_text = "".join(redacted_parts)
+    def submit(self, text: str) -> Future:
+        fut: Future = Future()
+        self._q.put((text, fut))
+        return fut
 
-    # Entities (consider omitting text for privacy)
-    entities = [{"label": "PII", "start": a, "end": b} for a, b in spans]
+    def _collect(self) -> List[Tuple[str, Future]]:
+        batch = [self._q.get()]
+        deadline = time.monotonic() + self.window_s
+        while len(batch) < self.max_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
 
-    return {"redacted_text": redacted_text, "entities": entities}
+    def _loop(self):
+        while True:
+            self._slots.acquire()
+            batch = self._collect()
+            try:
+                done = _run_batch([t for t, _ in batch])
+            except Exception as e:
+                # fail this batch, keep the thread alive for the next one
+                done = Future()
+                done.set_exception(e)
+            done.add_done_callback(lambda f, batch=batch: self._deliver(batch, f))
+
+    def _deliver(self, batch: List[Tuple[str, Future]], done: Future):
+        self._slots.release()
+        try:
+            results, _ = done.result()
+        except Exception as e:
+            for _, fut in batch:
+                try:
+                    fut.set_exception(e)
+                except InvalidStateError:
+                    pass  # caller timed out and cancelled it
+            return
+        for (_, fut), res in zip(batch, results):
+            try:
+                fut.set_result(res)
+            except InvalidStateError:
+                pass  # caller timed out and cancelled it
+
+# --- startup lifecycle
+def _warmup():
+    """
+    Run every (batch size, length) shape once per worker so the first real request
+    doesn't pay for allocator growth and kernel selection.
+    """
+    copies = max(1, INFER_WORKERS)
+    for n_tokens in WARMUP_LENGTHS:
+        text = " ".join(["warmup"] * max(1, n_tokens - 2))
+        for batch in sorted({1, max(1, BATCH_MAX_SIZE)}):
+            for f in [_run_batch([text] * batch) for _ in range(copies)]:
+                f.result()
+
+def _load():
+    """
+    Load tokenizer + engine (safetensors weights are memory-mapped), fork the worker
+    pool, warm up, then start the batcher and flip readiness. Timings go to /ready.
+    """
+    global tok, engine, IS_PII, _pool, _batcher
+    try:
+        t0 = time.time()
+        _state["phase"] = "loading"
+        tok = AutoTokenizer.from_pretrained(MODEL_DIR, use_fast=True, local_files_only=True)
+        engine = load_engine(INFER_ENGINE, MODEL_DIR, ENGINE_CACHE_DIR)
+        # label id -> "is PII" lookup for vectorised post-processing
+        IS_PII = np.array([engine.id2label[i] != "O" for i in range(len(engine.id2label))], dtype=bool)
+        _pool = _start_pool(INFER_WORKERS)
+        _state["load_ms"] = (time.time() - t0) * 1000.0
+
+        t1 = time.time()
+        _state["phase"] = "warming_up"
+        if WARMUP:
+            _warmup()
+        _state["warmup_ms"] = (time.time() - t1) * 1000.0
+
+        _batcher = _MicroBatcher(BATCH_MAX_SIZE, BATCH_WINDOW_MS, max_inflight=max(1, INFER_WORKERS))
+        _state.update(phase="ready", ready=True, ready_after_s=time.time() - _state["started_at"])
+    except Exception as e:
+        _state.update(phase="failed", error=f"Failed to load model from {MODEL_DIR}: {e}")
+
+def _require_ready():
+    if not _state["ready"]:
+        raise HTTPException(status_code=503, detail=f"Model not ready ({_state['phase']})")
+
+@app.get("/live")
+def live():
+    # a failed load can't recover on its own: let the orchestrator restart us
+    if _state["error"]:
+        raise HTTPException(status_code=500, detail=_state["error"])
+    if _batcher is not None and not _batcher._thread.is_alive():
+        raise HTTPException(status_code=500, detail="Batcher thread died")
+    return {"ok": True, "uptime_s": time.time() - _state["started_at"]}
+
+@app.get("/ready")
+def ready():
+    body = {k: v for k, v in _state.items() if k != "started_at"}
+    if not _state["ready"] or (_batcher is not None and not _batcher._thread.is_alive()):
+        raise HTTPException(status_code=503, detail=body)
+    return body
+
+async def _redact_one(text: str, mode: str) -> Dict[str, Any]:
+    """
+    Cache → detectors/pre-screen → (micro-batched) model → merged spans.
+    """
+    key = _cache.key(text, mode)
+    spans = _cache.get(key)
+    if spans is not None:
+        return redact(text, spans)
+    det, needs_model = _screen(text, mode)
+    model_out = None
+    if needs_model:
+        try:
+            model_out = await asyncio.wait_for(asyncio.wrap_future(_batcher.submit(text)), INFER_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail=f"Inference took longer than {INFER_TIMEOUT_S:g}s")
+    out = _combine(text, det, model_out)
+    _cache.put(key, out["entities"])
+    return out
 
 @app.get("/health")
 def health():
-    return {"ok": True, "device": DEVICE}
+    return {
+        "ok": True,
+        "ready": _state["ready"],
+        "device": DEVICE,
+        "engine": engine.name if engine is not None else INFER_ENGINE,
+        "workers": max(1, INFER_WORKERS),
+        "batch_max_size": BATCH_MAX_SIZE,
+        "cache": _cache.stats(),
+    }
 
 @app.post("/v1/anonymize/text")
-def anonymize_text(req: TextReq):
+async def anonymize_text(req: TextReq):
+    _require_ready()
     try:
         t0 = time.time()
-        out = _predict(req.text or "")
+        out = await _redact_one(req.text or "", req.mode)
         out["timing_ms"] = (time.time() - t0) * 1000.0
         # Gateway adds attestation + logs audit
         return out
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/v1/anonymize/text/batch")
+async def anonymize_text_batch(request: Request):
+    """
+    Body is either {"items": [TextReq, ...]} or NDJSON (application/x-ndjson),
+    one TextReq per line. Results come back in input order.
+    """
+    _require_ready()
+    t0 = time.time()
+    body = await request.body()
+    try:
+        if "ndjson" in request.headers.get("content-type", ""):
+            items = [TextReq.model_validate_json(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = BatchReq.model_validate_json(body).items
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ITEMS} items per batch")
+
+    try:
+        results = await run_in_threadpool(
+            _predict_bulk, [it.text or "" for it in items], [it.mode for it in items]
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {"results": results, "timing_ms": (time.time() - t0) * 1000.0}
+
+class _DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that doesn't listen for http.disconnect while streaming: that
+    listener would swallow the request body the generator is still reading.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+@app.post("/v1/anonymize/text/stream")
+async def anonymize_text_stream(request: Request, mode: Literal["smart", "strict"] = "smart"):
+    """
+    Raw (optionally chunked) UTF-8 body in, NDJSON out: one line per segment with its
+    char offset in the document, redacted_text and entities in document coordinates,
+    then a final {"done": true, ...} line. Input is read only as fast as segments are
+    redacted, so memory stays bounded by a few segments regardless of document size.
+    """
+    _require_ready()
+
+    async def gen() -> AsyncIterator[bytes]:
+        t0 = time.time()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending: deque = deque()  # (offset, length, task) in document order
+        buf, offset, n_segments = "", 0, 0
+
+        def flush_ready(final: bool):
+            nonlocal buf, offset
+            while True:
+                cut = _next_segment(buf, STREAM_SEGMENT_CHARS, final)
+                if not cut:
+                    return
+                seg, buf = buf[:cut], buf[cut:]
+                pending.append((offset, len(seg), asyncio.ensure_future(_redact_one(seg, mode))))
+                offset += len(seg)
+
+        async def emit() -> bytes:
+            nonlocal n_segments
+            off, length, task = pending.popleft()
+            out = await task
+            n_segments += 1
+            entities = [{**e, "start": e["start"] + off, "end": e["end"] + off} for e in out["entities"]]
+            line = {"offset": off, "length": length, "redacted_text": out["redacted_text"], "entities": entities}
+            return (json.dumps(line) + "\n").encode()
+
+        try:
+            async for chunk in request.stream():
+                buf += decoder.decode(chunk)
+                flush_ready(final=False)
+                while len(pending) >= max(1, STREAM_INFLIGHT):
+                    yield await emit()
+            buf += decoder.decode(b"", final=True)
+            flush_ready(final=True)
+            while pending:
+                yield await emit()
+        except Exception as e:
+            for _, _, task in pending:
+                task.cancel()
+            yield (json.dumps({"error": str(e)}) + "\n").encode()
+            return
+        done = {"done": True, "chars": offset, "segments": n_segments, "timing_ms": (time.time() - t0) * 1000.0}
+        yield (json.dumps(done) + "\n").encode()
+
+    return _DuplexStreamingResponse(gen(), media_type="application/x-ndjson")
@@ -0,0 +1,79 @@
+# prismguard_llm/bench_postprocess.py
+"""
+Micro-benchmark for the post-inference step of the text guard: the old pure-Python
+char mask vs. postprocess.token_spans. Needs only NumPy (no model, no torch).
+
+    python bench_postprocess.py [--sizes-kb 10 100] [--repeat 5]
+"""
+import argparse, random, time
+from typing import List
+
+import numpy as np
+
+from postprocess import token_spans
+
+def _char_mask_spans(n_chars: int, offsets: List[List[int]], flagged: List[bool]) -> List[List[int]]:
+    # the implementation _predict used before vectorisation
+    char_mask = [0] * n_chars
+    for (a, b), f in zip(offsets, flagged):
+        if b == 0 or not f:
+            continue
+        aa = max(0, min(a, n_chars))
+        bb = max(aa, min(b, n_chars))
+        for i in range(aa, bb):
+            char_mask[i] = 1
+    spans = []
+    i = 0
+    while i < n_chars:
+        if char_mask[i] == 1:
+            j = i + 1
+            while j < n_chars and char_mask[j] == 1:
+                j += 1
+            spans.append([i, j])
+            i = j
+        else:
+            i += 1
+    return spans
+
+def _synthetic(size_kb: int, pii_rate: float, rng: random.Random):
+    words, offsets, pos = [], [], 0
+    while pos < size_kb * 1024:
+        w = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(rng.randint(2, 9)))
+        words.append(w)
+        offsets.append([pos, pos + len(w)])
+        pos += len(w) + 1
+    text = " ".join(words)
+    offsets = [[0, 0]] + offsets + [[0, 0]]  # [CLS] ... [SEP]
+    labels = [0] + [1 if rng.random() < pii_rate else 0 for _ in words] + [0]
+    return text, offsets, labels
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes-kb", type=int, nargs="+", default=[10, 100])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--pii-rate", type=float, default=0.1)
+    args = ap.parse_args()
+
+    rng = random.Random(0)
+    is_pii = np.array([False, True])
+    for kb in args.sizes_kb:
+        text, offsets, labels = _synthetic(kb, args.pii_rate, rng)
+        offs_np, labs_np = np.array(offsets), np.array(labels)
+        flagged = [bool(is_pii[x]) for x in labels]
+
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            ref = _char_mask_spans(len(text), offsets, flagged)
+        t_old = (time.perf_counter() - t0) / args.repeat * 1000.0
+
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            new = token_spans(offs_np, labs_np, is_pii, len(text))
+        t_new = (time.perf_counter() - t0) / args.repeat * 1000.0
+
+        assert new.tolist() == ref, "vectorised spans differ from the char-mask reference"
+        print(f"{kb:>5} KB  tokens={len(offsets):>7}  spans={len(ref):>6}  "
+              f"char-mask={t_old:8.2f} ms  numpy={t_new:7.2f} ms  speedup={t_old / max(t_new, 1e-9):6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# prismguard_llm/cache.py
+import time, hashlib, threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+Span = Tuple[int, int, str]
+
+# rough per-entry cost: digest key + OrderedDict node + tuple/timestamp headers
+_ENTRY_OVERHEAD = 160
+_SPAN_BYTES = 72
+
+class RedactionCache:
+    """
+    Bounded LRU (optional TTL) of redaction results keyed by a SHA-256 digest of
+    (revision, mode, text). Values hold only (start, end, label) spans, never the text,
+    so the cache can't leak plaintext; the caller re-applies spans to its own input.
+    """
+
+    def __init__(self, revision: str, max_entries: int, max_bytes: int, ttl_s: float = 0.0):
+        self.revision = revision
+        self.max_entries = max(0, max_entries)
+        self.max_bytes = max(0, max_bytes)
+        self.ttl_s = max(0.0, ttl_s)
+        self._data: "OrderedDict[bytes, Tuple[float, Tuple[Span, ...]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def key(self, text: str, mode: str) -> bytes:
+        h = hashlib.sha256()
+        for part in (self.revision, mode, text):
+            h.update(part.encode("utf-8", "surrogatepass"))
+            h.update(b"\0")
+        return h.digest()
+
+    @staticmethod
+    def _size(spans: Tuple[Span, ...]) -> int:
+        return _ENTRY_OVERHEAD + _SPAN_BYTES * len(spans)
+
+    def get(self, key: bytes) -> Optional[List[Span]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl_s and time.monotonic() - item[0] > self.ttl_s:
+                self._drop(key)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return list(item[1])
+
+    def put(self, key: bytes, entities: List[Dict[str, Any]]):
+        if not self.enabled:
+            return
+        spans = tuple((e["start"], e["end"], e["label"]) for e in entities)
+        size = self._size(spans)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic(), spans)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def _drop(self, key: bytes):
+        _, spans = self._data.pop(key)
+        self._bytes -= self._size(spans)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
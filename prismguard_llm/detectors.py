@@ -0,0 +1,111 @@
+# prismguard_llm/detectors.py
+import re, ipaddress
+from typing import List, Tuple
+
+Span = Tuple[int, int, str]
+
+# --- compiled detectors (checked in this order; earlier labels win on overlap)
+_EMAIL = re.compile(r"(?<![\w.+-])[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}\b")
+_IBAN = re.compile(r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b")
+_CARD = re.compile(r"(?<![\d-])\d(?:[ -]?\d){12,18}(?![\d-])")
+_SSN = re.compile(r"(?<![\d-])\d{3}-\d{2}-\d{4}(?![\d-])")
+_IPV4 = re.compile(r"(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?![\d.])")
+_IPV6 = re.compile(r"(?<![\w:])(?:[0-9A-Fa-f]{0,4}:){2,7}[0-9A-Fa-f]{0,4}(?![\w:])")
+_PHONE = re.compile(r"(?<![\w+])(?:\+\d{1,3}[ .-]?)?(?:\(\d{1,4}\)[ .-]?)?\d{2,4}(?:[ .-]?\d{2,4}){1,4}(?!\w)")
+# strict mode only: any long digit run (account numbers, ids, ...)
+_DIGITS = re.compile(r"(?<![\w-])\d(?:[ .-]?\d){5,}(?![\w-])")
+
+def _digits(s: str) -> str:
+    return "".join(c for c in s if c.isdigit())
+
+def _luhn_ok(number: str) -> bool:
+    total = 0
+    for i, c in enumerate(reversed(number)):
+        d = int(c)
+        if i % 2:
+            d = d * 2 - 9 if d > 4 else d * 2
+        total += d
+    return total % 10 == 0
+
+def _iban_ok(s: str) -> bool:
+    s = s.replace(" ", "")
+    if not 15 <= len(s) <= 34:
+        return False
+    rearranged = s[4:] + s[:4]
+    return int("".join(str(int(c, 36)) for c in rearranged)) % 97 == 1
+
+def _ip_ok(s: str) -> bool:
+    try:
+        ipaddress.ip_address(s)
+        return True
+    except ValueError:
+        return False
+
+_DATE = re.compile(r"\d{4}[./-]\d{1,2}[./-]\d{1,2}|\d{1,2}[./-]\d{1,2}[./-]\d{2,4}")
+
+def _phone_ok(s: str) -> bool:
+    if not 7 <= len(_digits(s)) <= 15:
+        return False
+    # an explicit country or area code is phone-like enough
+    if s.startswith(("+", "(")):
+        return True
+    # otherwise grouped like a number (2-4 digit groups, 3-4 digit last group) and not a
+    # date; bare digit runs, ids and "12 34 56 78" style amounts are too ambiguous
+    groups = re.split(r"[ .-]", s)
+    return (len(groups) >= 2 and all(2 <= len(g) <= 4 for g in groups)
+            and len(groups[-1]) >= 3 and not _DATE.fullmatch(s))
+
+_DETECTORS = [
+    ("EMAIL", _EMAIL, None),
+    ("IBAN", _IBAN, _iban_ok),
+    ("CARD", _CARD, lambda s: 13 <= len(_digits(s)) <= 19 and _luhn_ok(_digits(s))),
+    ("SSN", _SSN, None),
+    ("IP", _IPV4, _ip_ok),
+    ("IP", _IPV6, _ip_ok),
+    ("PHONE", _PHONE, _phone_ok),
+]
+_STRICT_DETECTORS = _DETECTORS + [("NUMBER", _DIGITS, None)]
+
+def detect(text: str, strict: bool = False) -> List[Span]:
+    """
+    Deterministic PII spans (start, end, label), non-overlapping and sorted.
+    strict=True adds broader patterns that trade precision for recall.
+    """
+    claimed: List[Span] = []
+    for label, pattern, valid in (_STRICT_DETECTORS if strict else _DETECTORS):
+        for m in pattern.finditer(text):
+            a, b = m.span()
+            if valid is not None and not valid(m.group()):
+                continue
+            if any(a < e and s < b for s, e, _ in claimed):
+                continue
+            claimed.append((a, b, label))
+    return sorted(claimed)
+
+_FENCED = re.compile(r"\A\s*```[^\n]*\n(?:(?!\n```).)*\n```\s*\Z", re.S)
+# chat filler and function words that are never PII on their own; deliberately excludes
+# words that double as names or places (may, will, bill, mark, grace, june, ...)
+_STOPWORDS = frozenset("""
+a an the and or but so if then than of to in on at by for with from about as into up down
+out over off again too very just not no yes yeah yep nope ok okay sure fine cool great nice good
+bad right wrong well i i'm i'll i've i'd me my mine we us our you your it it's its this that
+these those there here is am are was were be been being do does did done have has had can
+could should would shall must might what which who whom whose when where why how all any some
+more most much many few other such only own same both each every thanks thank thx please pls
+hi hello hey hiya bye goodbye morning afternoon evening night lol haha hmm oh ah wow oops sorry
+let's lets go got get know think see mean try again help tell explain show continue stop start
+""".split())
+
+def prescreen(text: str, max_chars: int) -> bool:
+    """
+    True only when the text cannot carry PII: a single fenced code block, or a short turn
+    (<= max_chars) made up entirely of words from _STOPWORDS. Anything else, including
+    all-lowercase text ("i live in paris"), goes to the model.
+    """
+    if _FENCED.match(text):
+        return True
+    t = text.strip()
+    if len(t) > max_chars:
+        return False
+    words = [w.strip(".,!?;:'\"()").lower() for w in t.split()]
+    return all(w in _STOPWORDS for w in words if w)
@@ -0,0 +1,169 @@
+# prismguard_llm/engines.py
+import os, shutil, inspect, tempfile, argparse
+from typing import Dict
+
+import numpy as np
+import torch
+from transformers import AutoModelForTokenClassification
+
+# INFER_ENGINE values understood by load_engine
+ENGINES = ("torch", "torch-int8", "onnx", "onnx-int8")
+ONNX_OPSET = 14
+
+class TorchEngine:
+    """
+    Eager PyTorch token classifier. With quantize=True the Linear layers are
+    dynamically quantized to int8 (weights int8, activations quantized per batch).
+    """
+
+    def __init__(self, model_dir: str, quantize: bool = False):
+        model = AutoModelForTokenClassification.from_pretrained(model_dir, local_files_only=True)
+        model.eval()
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.name = "torch-int8" if quantize else "torch"
+        self.id2label = model.config.id2label
+
+    def share_memory(self):
+        # move weights to shared memory so forked workers never copy them, even on write
+        self.model.share_memory()
+
+    def __call__(self, feeds: Dict[str, np.ndarray]) -> np.ndarray:
+        with torch.inference_mode():
+            enc = {k: torch.from_numpy(v) for k, v in feeds.items()}
+            return self.model(**enc).logits.numpy()  # (rows, seq_len, num_labels)
+
+class OnnxEngine:
+    """
+    ONNX Runtime session over an export of the model in MODEL_DIR.
+    The export (and its int8 variant) is built on first use and cached in cache_dir.
+    ORT sessions don't survive fork(), so each process opens its own on first call.
+    """
+
+    def __init__(self, model_dir: str, cache_dir: str, quantize: bool = False):
+        path = export_onnx(model_dir, cache_dir)
+        self.path = quantize_onnx(path) if quantize else path
+        self.name = "onnx-int8" if quantize else "onnx"
+        self.id2label = _load_id2label(model_dir)
+        self._pid = None
+        self._open()
+
+    def _open(self):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = int(os.getenv("TORCH_NUM_THREADS", "1"))
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self._pid = os.getpid()
+
+    def share_memory(self):
+        # nothing to share: workers re-open the session from the (page-cached) file
+        pass
+
+    def __call__(self, feeds: Dict[str, np.ndarray]) -> np.ndarray:
+        if self._pid != os.getpid():
+            self._open()
+        inputs = {k: feeds[k].astype(np.int64) for k in self.input_names}
+        return self.session.run(["logits"], inputs)[0]
+
+def _load_id2label(model_dir: str) -> Dict[int, str]:
+    from transformers import AutoConfig
+
+    return AutoConfig.from_pretrained(model_dir, local_files_only=True).id2label
+
+def export_onnx(model_dir: str, cache_dir: str) -> str:
+    """
+    Export the token classifier to ONNX with dynamic batch/sequence axes.
+    Returns the cached file if it already exists.
+    """
+    path = os.path.join(cache_dir, "model.onnx")
+    if os.path.exists(path):
+        return path
+    os.makedirs(cache_dir, exist_ok=True)
+
+    model = AutoModelForTokenClassification.from_pretrained(model_dir, local_files_only=True)
+    model.eval()
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    dummy = tuple(torch.ones((1, 8), dtype=torch.long) for _ in names)
+    axes = {n: {0: "batch", 1: "seq"} for n in names + ["logits"]}
+    kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+
+    tmp = path + ".tmp"
+    with torch.inference_mode():
+        torch.onnx.export(
+            model, dummy, tmp,
+            input_names=names, output_names=["logits"],
+            dynamic_axes=axes, opset_version=ONNX_OPSET, **kwargs,
+        )
+    os.replace(tmp, path)  # concurrent replicas never see a half-written file
+    return path
+
+def quantize_onnx(path: str) -> str:
+    """
+    Dynamic int8 quantization of an exported model (weights int8, activations at runtime).
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    out = path.replace(".onnx", ".int8.onnx")
+    if not os.path.exists(out):
+        tmp = out + ".tmp"
+        quantize_dynamic(path, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, out)
+    return out
+
+def ensure_safetensors(model_dir: str, cache_dir: str) -> str:
+    """
+    Directory holding the weights as model.safetensors, which from_pretrained memory-maps
+    instead of unpickling. A pytorch_model.bin is converted once, next to it if MODEL_DIR
+    is writable, else into cache_dir/safetensors.
+    """
+    if os.path.exists(os.path.join(model_dir, "model.safetensors")):
+        return model_dir
+    if not os.path.exists(os.path.join(model_dir, "pytorch_model.bin")):
+        return model_dir
+    converted = os.path.join(cache_dir, "safetensors")
+    if os.path.exists(os.path.join(converted, "model.safetensors")):
+        return converted
+
+    model = AutoModelForTokenClassification.from_pretrained(model_dir, local_files_only=True)
+    for target in (model_dir, converted):
+        try:
+            os.makedirs(target, exist_ok=True)
+            tmp = tempfile.mkdtemp(dir=target)
+            try:
+                model.save_pretrained(tmp, safe_serialization=True)
+                if target != model_dir:
+                    os.replace(os.path.join(tmp, "config.json"), os.path.join(target, "config.json"))
+                os.replace(os.path.join(tmp, "model.safetensors"), os.path.join(target, "model.safetensors"))
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+            return target
+        except OSError:
+            continue
+    return model_dir
+
+def load_engine(name: str, model_dir: str, cache_dir: str):
+    weights_dir = ensure_safetensors(model_dir, cache_dir)
+    if name == "torch":
+        return TorchEngine(weights_dir)
+    if name == "torch-int8":
+        return TorchEngine(weights_dir, quantize=True)
+    if name == "onnx":
+        return OnnxEngine(weights_dir, cache_dir)
+    if name == "onnx-int8":
+        return OnnxEngine(weights_dir, cache_dir, quantize=True)
+    raise ValueError(f"Unknown INFER_ENGINE {name!r}; expected one of {', '.join(ENGINES)}")
+
+if __name__ == "__main__":
+    # pre-build artifacts at image build time so replicas don't pay for them on cold start:
+    #   python engines.py --engine onnx-int8
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model-dir", default=os.getenv("MODEL_DIR", "/app/model"))
+    ap.add_argument("--cache-dir", default=os.getenv("ENGINE_CACHE_DIR"))
+    ap.add_argument("--engine", default=os.getenv("INFER_ENGINE", "torch"), choices=ENGINES)
+    args = ap.parse_args()
+    load_engine(args.engine, args.model_dir, args.cache_dir or os.path.join(args.model_dir, "onnx"))
@@ -0,0 +1,113 @@
+# prismguard_llm/parity.py
+"""
+Check that alternative inference engines redact a reference corpus exactly like
+the eager torch engine, and report per-token latency and resident memory for each.
+
+Each engine runs in a fresh process (exports are built in a separate one first), so
+rss is that engine's steady-state resident set after warm-up and timing runs, +engine
+its growth over the process with only the tokenizer loaded, and peak the high-water mark.
+
+    MODEL_DIR=/app/model python parity.py [--engines onnx onnx-int8 torch-int8] [--corpus texts.txt]
+
+Exits non-zero if any engine's match rate is below --min-match.
+"""
+import os, sys, time, argparse, resource
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import numpy as np
+from transformers import AutoTokenizer
+
+from engines import ENGINES, load_engine
+from postprocess import token_spans, redact
+
+MODEL_DIR = os.getenv("MODEL_DIR", "/app/model")
+ENGINE_CACHE_DIR = os.getenv("ENGINE_CACHE_DIR", os.path.join(MODEL_DIR, "onnx"))
+MAX_LEN = int(os.getenv("MAX_LEN", "128"))
+
+REFERENCE_CORPUS = [
+    "Hi, I'm John Doe, my SSN is 123-45-6789",
+    "Please send the invoice to maria.garcia@example.com by Friday.",
+    "Call me on +44 20 7946 0958 or at my office in Manchester.",
+    "My card number is 4111 1111 1111 1111, expiry 09/27.",
+    "ok thanks",
+    "Patient Wei Zhang, born 1984-03-12, lives at 221B Baker Street, London.",
+    "The server at 192.168.10.24 keeps dropping connections.",
+    "Transfer to IBAN DE89 3704 0044 0532 0130 00, reference Anna Schmidt.",
+    "def add(a, b):\n    return a + b",
+    "Can you summarise this paragraph for me?",
+    "Dr. Priya Natarajan will see you at 3pm; her pager is 555-0142.",
+    "Username: jsmith84, password hint: first dog's name.",
+]
+
+def _redact_all(tok, engine, texts: List[str]):
+    enc = tok(texts, return_offsets_mapping=True, truncation=True, max_length=MAX_LEN,
+              padding=True, return_tensors="np")
+    offsets = enc.pop("offset_mapping")
+    t0 = time.perf_counter()
+    pred_ids = engine(dict(enc)).argmax(-1)
+    elapsed = time.perf_counter() - t0
+    is_pii = np.array([engine.id2label[i] != "O" for i in range(len(engine.id2label))], dtype=bool)
+    outs = [redact(t, token_spans(o, p, is_pii, len(t)).tolist())["redacted_text"]
+            for t, o, p in zip(texts, offsets, pred_ids)]
+    return outs, elapsed, int(enc["attention_mask"].sum())
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+def _prepare(name: str):
+    # build/quantize exports so their cost doesn't show up in the measured process
+    load_engine(name, MODEL_DIR, ENGINE_CACHE_DIR)
+
+def _measure(name: str, texts: List[str], repeat: int):
+    tok = AutoTokenizer.from_pretrained(MODEL_DIR, use_fast=True, local_files_only=True)
+    tok(texts, truncation=True, max_length=MAX_LEN, padding=True)  # tokenizer buffers go in the baseline
+    base = _rss_mb()
+    engine = load_engine(name, MODEL_DIR, ENGINE_CACHE_DIR)
+    _redact_all(tok, engine, texts)  # warm-up
+    best = float("inf")
+    for _ in range(repeat):
+        outs, elapsed, n_tokens = _redact_all(tok, engine, texts)
+        best = min(best, elapsed)
+    return outs, best, n_tokens, base, _rss_mb(), _peak_rss_mb()
+
+def _isolated(fn, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as ex:
+        return ex.submit(fn, *args).result()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--engines", nargs="+", default=[e for e in ENGINES if e != "torch"])
+    ap.add_argument("--corpus", help="file with one reference text per line")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--min-match", type=float, default=1.0)
+    args = ap.parse_args()
+
+    texts = REFERENCE_CORPUS
+    if args.corpus:
+        with open(args.corpus) as f:
+            texts = [line.rstrip("\n") for line in f if line.strip()]
+
+    ok = True
+    ref = None
+    for name in ["torch"] + [e for e in args.engines if e != "torch"]:
+        _isolated(_prepare, name)
+        outs, best, n_tokens, base, rss, peak = _isolated(_measure, name, texts, args.repeat)
+        if ref is None:
+            ref = outs
+        match = sum(a == b for a, b in zip(outs, ref)) / len(ref)
+        print(f"{name:>10}  match={match:6.1%}  {best / n_tokens * 1e6:8.2f} us/token  "
+              f"rss={rss:7.1f} MB  +engine={rss - base:7.1f} MB  peak={peak:7.1f} MB")
+        for t, a, b in zip(texts, outs, ref):
+            if a != b:
+                print(f"    differs: {t[:60]!r}\n      torch: {b[:80]!r}\n      {name}: {a[:80]!r}")
+        ok &= match >= args.min_match
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# prismguard_llm/postprocess.py
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+REDACTION = "[REDACTED]"
+
+def token_spans(offsets: np.ndarray, pred_ids: np.ndarray, is_pii: np.ndarray, n_chars: int) -> np.ndarray:
+    """
+    Merge flagged token offsets into char spans without materialising a char mask.
+    offsets: (..., 2) char offsets, pred_ids: (...) label ids, is_pii: (num_labels,) bool.
+    Tokens that touch or overlap (including across overlapping windows) merge into one span.
+    Returns an (n_spans, 2) int array of [start, end) sorted by start.
+    """
+    offsets = np.asarray(offsets).reshape(-1, 2)
+    pred_ids = np.asarray(pred_ids).reshape(-1)
+
+    # padding and specials like [CLS]/[SEP] have (0,0) offsets -> empty after clipping
+    starts = np.clip(offsets[:, 0], 0, n_chars)
+    ends = np.clip(offsets[:, 1], 0, n_chars)
+    keep = is_pii[pred_ids] & (ends > starts)
+    if not keep.any():
+        return np.empty((0, 2), dtype=np.int64)
+
+    starts, ends = starts[keep], ends[keep]
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+
+    # interval merge: a new span begins where a token starts past everything seen so far
+    reach = np.maximum.accumulate(ends)
+    first = np.empty(len(starts), dtype=bool)
+    first[0] = True
+    first[1:] = starts[1:] > reach[:-1]
+    heads = np.flatnonzero(first)
+    tails = np.append(heads[1:] - 1, len(starts) - 1)
+    return np.stack([starts[heads], reach[tails]], axis=1).astype(np.int64)
+
+def merge_spans(*span_lists: List[Tuple]) -> List[Tuple[int, int, str]]:
+    """
+    Union of several span lists ((start, end) or (start, end, label)) into sorted,
+    non-overlapping (start, end, label) spans. Touching or overlapping spans merge; a
+    merged span keeps the first specific (non-"PII") label it contains.
+    """
+    spans = sorted((s[0], s[1], s[2] if len(s) > 2 else "PII") for lst in span_lists for s in lst)
+    merged: List[List] = []
+    for a, b, label in spans:
+        if merged and a <= merged[-1][1]:
+            last = merged[-1]
+            last[1] = max(last[1], b)
+            if last[2] == "PII":
+                last[2] = label
+        else:
+            merged.append([a, b, label])
+    return [tuple(m) for m in merged]
+
+def redact(text: str, spans: List[Tuple]) -> Dict[str, Any]:
+    """
+    Replace each [start, end) span (optionally (start, end, label)) with [REDACTED].
+    Returns redacted_text and simple spans (start,end,label).
+    """
+    redacted_parts = []
+    entities = []
+    last = 0
+    for span in spans:
+        a, b = span[0], span[1]
+        if a > last:
+            redacted_parts.append(text[last:a])
+        redacted_parts.append(REDACTION)
+        last = b
+        # Entities (consider omitting text for privacy)
+        entities.append({"label": span[2] if len(span) > 2 else "PII", "start": a, "end": b})
+    if last < len(text):
+        redacted_parts.append(text[last:])
+
+    return {"redacted_text": "".join(redacted_parts), "entities": entities}
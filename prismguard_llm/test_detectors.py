@@ -0,0 +1,53 @@
+# prismguard_llm/test_detectors.py
+import pytest
+
+from prismguard_llm.detectors import detect, prescreen, _iban_ok, _luhn_ok
+
+def labels(text, strict=False):
+    return [(text[a:b], label) for a, b, label in detect(text, strict)]
+
+@pytest.mark.parametrize("text", [
+    "Meeting on 2023-10-18",
+    "time 12:30 on 12.05.2024",
+    "due 18/10/2023 or 18-10-2023",
+    "order #12 34 56 78",
+    "build 20240101 1234",
+    "it costs 1999 dollars in 2024",
+])
+def test_no_phone_in_dates_ids_and_amounts(text):
+    assert not [l for l in labels(text) if l[1] == "PHONE"]
+
+@pytest.mark.parametrize("phone", [
+    "+1 555 123 4567", "+44 20 7946 0958", "(555) 123-4567", "555-123-4567", "020 7946 0958",
+])
+def test_phone(phone):
+    assert labels(f"call me at {phone} tonight") == [(phone, "PHONE")]
+
+def test_email_ip_ssn():
+    assert labels("mail jane.doe@example.com from 192.168.0.1, ssn 123-45-6789") == [
+        ("jane.doe@example.com", "EMAIL"), ("192.168.0.1", "IP"), ("123-45-6789", "SSN")]
+
+def test_card_luhn():
+    assert _luhn_ok("4111111111111111")
+    assert not _luhn_ok("4111111111111112")
+    assert labels("card 4111 1111 1111 1111") == [("4111 1111 1111 1111", "CARD")]
+    assert not [l for l in labels("card 4111 1111 1111 1112") if l[1] == "CARD"]
+
+def test_iban_checksum():
+    assert _iban_ok("GB82 WEST 1234 5698 7654 32")
+    assert not _iban_ok("GB82 WEST 1234 5698 7654 33")
+    assert labels("pay GB82 WEST 1234 5698 7654 32 now") == [("GB82 WEST 1234 5698 7654 32", "IBAN")]
+
+def test_strict_adds_digit_runs():
+    assert labels("ref 20240101 1234", strict=True) == [("20240101 1234", "NUMBER")]
+
+@pytest.mark.parametrize("text", ["thanks!", "Hello, how are you?", "Can you help me?", "```py\nx = 1\n```"])
+def test_prescreen_skips(text):
+    assert prescreen(text, 64)
+
+@pytest.mark.parametrize("text", [
+    "my name is john smith", "Sarah said no", "John here.", "i live in paris",
+    "call me maybe, ask for jenny", "will do", "thanks " * 20,
+])
+def test_prescreen_sends_to_model(text):
+    assert not prescreen(text, 64)
@@ -1,13 +1,89 @@
 # prismguard_vision/app.py
-import io, base64, time, tempfile
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+import os, io, json, uuid, zlib, base64, time, asyncio, hashlib, tarfile, tempfile, zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from starlette.datastructures import UploadFile as FormFile
 from pydantic import BaseModel
 from typing import List, Optional
-from PIL import Image
-from .wrapper import anonymize_image, anonymize_video
+from .wrapper import (
+    anonymize_image, anonymize_images, anonymize_video, get_pool, detector_backend, decode_image,
+    Codec, CODECS, sniff_format, shutdown_segment_pool,
+    VISION_WORKERS, VISION_BACKEND, MODEL_PATH, DETECTION_CONF, IMG_BLUR_RADIUS,
+)
+from .obfuscate import obfuscate, OBFUSCATION_METHOD, FILL_COLOR
+from .profiles import DetectProfile
+from .cache import ResultCache
+from .jobs import JobStore
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="PrismGuard Vision", version="0.1.0")
+# Requests beyond VISION_WORKERS running + VISION_QUEUE_MAX waiting are rejected with 503
+VISION_QUEUE_MAX = int(os.getenv("VISION_QUEUE_MAX", str(4 * VISION_WORKERS)))
+# upper bound on images per /v1/anonymize/images request
+VISION_BATCH_MAX_ITEMS = int(os.getenv("VISION_BATCH_MAX_ITEMS", "64"))
+# binary responses carry entities in X-Entities up to this many bytes, else fall back to multipart/mixed
+VISION_ENTITIES_HEADER_MAX = int(os.getenv("VISION_ENTITIES_HEADER_MAX", "4096"))
+# upper bound on an archive's upload size and on its members' summed uncompressed size
+VISION_BATCH_MAX_BYTES = int(os.getenv("VISION_BATCH_MAX_MB", "256")) * 1024 * 1024
+
+# video jobs: uploads are streamed to VIDEO_JOB_DIR and processed in the background
+VIDEO_JOB_DIR = os.getenv("VIDEO_JOB_DIR", os.path.join(tempfile.gettempdir(), "pg_video_jobs"))
+VIDEO_JOB_WORKERS = int(os.getenv("VIDEO_JOB_WORKERS", "1"))
+VIDEO_JOB_MAX_PENDING = int(os.getenv("VIDEO_JOB_MAX_PENDING", "8"))
+VIDEO_JOB_TTL_S = float(os.getenv("VIDEO_JOB_TTL_S", "3600"))
+VIDEO_MAX_UPLOAD_BYTES = int(os.getenv("VIDEO_MAX_UPLOAD_MB", "2048")) * 1024 * 1024
+UPLOAD_CHUNK = 1024 * 1024
+
+# result cache (pixel digest -> detections [+ encoded output]); VISION_CACHE_MAX_BYTES=0 disables it
+VISION_CACHE_MAX_BYTES = int(os.getenv("VISION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+VISION_CACHE_STORE_OUTPUT = os.getenv("VISION_CACHE_STORE_OUTPUT", "1") == "1"
+VISION_CACHE_SPILL_DIR = os.getenv("VISION_CACHE_SPILL_DIR", "")
+VISION_CACHE_SPILL_MAX_BYTES = int(os.getenv("VISION_CACHE_SPILL_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+def _cache_revision() -> str:
+    """
+    Cache namespace: anything that can change the output for a given image.
+    VISION_CACHE_REVISION overrides the digest of the weights + detection/obfuscation settings.
+    """
+    if os.getenv("VISION_CACHE_REVISION"):
+        return os.environ["VISION_CACHE_REVISION"]
+    h = hashlib.sha256()
+    with open(MODEL_PATH, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    h.update(json.dumps([VISION_BACKEND, DETECTION_CONF, IMG_BLUR_RADIUS, OBFUSCATION_METHOD, FILL_COLOR]).encode())
+    return h.hexdigest()[:16]
+
+_cache = ResultCache(_cache_revision(), VISION_CACHE_MAX_BYTES, VISION_CACHE_STORE_OUTPUT,
+                     VISION_CACHE_SPILL_DIR, VISION_CACHE_SPILL_MAX_BYTES)
+
+_executor = ThreadPoolExecutor(max_workers=VISION_WORKERS, thread_name_prefix="pg-vision")
+_inflight = 0  # only touched from the event loop thread
+_jobs = JobStore(VIDEO_JOB_DIR, VIDEO_JOB_WORKERS, VIDEO_JOB_TTL_S, VIDEO_JOB_MAX_PENDING)
+
+@contextmanager
+def _admit():
+    global _inflight
+    if _inflight >= VISION_WORKERS + VISION_QUEUE_MAX:
+        raise HTTPException(status_code=503, detail="Vision workers saturated, retry later",
+                            headers={"Retry-After": "1"})
+    _inflight += 1
+    try:
+        yield
+    finally:
+        _inflight -= 1
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_pool()  # load the detectors once, before the first request
+    yield
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _jobs.shutdown()
+    shutdown_segment_pool()
+
+app = FastAPI(title="PrismGuard Vision", version="0.1.0", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
 class Entity(BaseModel):
@@ -17,50 +93,360 @@ class Entity(BaseModel):
 
 class ImgResp(BaseModel):
     redacted_image_b64: str
+    media_type: str
     entities: List[Entity]
     timing_ms: float
 
+class BatchItem(BaseModel):
+    name: str
+    redacted_image_b64: Optional[str] = None
+    media_type: Optional[str] = None
+    entities: List[Entity] = []
+    error: Optional[str] = None
+
+class BatchResp(BaseModel):
+    results: List[BatchItem]
+    timing_ms: float
+
 class VidResp(BaseModel):
     redacted_video_path: str
     timing_ms: float
 
+class JobResp(BaseModel):
+    job_id: str
+    status: str
+    frames_done: int
+    frames_total: int
+    fps: float
+    error: Optional[str] = None
+    result_url: Optional[str] = None
+
+def _job_resp(job) -> JobResp:
+    return JobResp(**job.view(), result_url=f"/v1/jobs/{job.id}/result" if job.status == "done" else None)
+
 @app.get("/health")
 def health():
-    return {"ok": True}
+    return {"ok": True, "backend": detector_backend()[0], "workers": VISION_WORKERS, "inflight": _inflight, "cache": _cache.stats()}
+
+def _encode_cached(img, key: bytes, codec: Codec):
+    """
+    Redacted bytes and entities from the cache, or None on a miss. A hit without a stored
+    output for this codec re-applies the cached boxes, still without inference.
+    """
+    hit = _cache.get(key, codec.tag)
+    if hit is None:
+        return None
+    entities, out = hit
+    if out is None:
+        out = codec.encode(obfuscate(img, [e["bbox"] for e in entities], IMG_BLUR_RADIUS))
+        _cache.put(key, entities, codec.tag, out)
+    return out, entities
+
+def _process_image(data: bytes, codec: Optional[Codec], profile: DetectProfile):
+    # whole decode -> detect -> blur -> encode path runs on a worker thread
+    codec = codec or Codec(sniff_format(data))
+    img = decode_image(data)
+    key = _cache.key(img, profile.tag)
+    hit = _encode_cached(img, key, codec)
+    if hit is not None:
+        return hit + (codec,)
+    res = anonymize_image(img, profile)
+    out = codec.encode(res["image"])
+    _cache.put(key, res["entities"], codec.tag, out)
+    return out, res["entities"], codec
+
+def _requested_codec(fmt: Optional[str], quality: Optional[int], png_level: Optional[int],
+                     accept: str) -> Optional[Codec]:
+    """
+    Output codec from the 'format' field, else from an Accept header naming a supported
+    image type; None means "same format as the upload".
+    """
+    if not fmt:
+        wanted = [t.split(";")[0].strip() for t in accept.split(",")]
+        fmt = next((f for f, (_, mt) in CODECS.items() if mt in wanted), None)
+    if fmt in (None, "", "input"):
+        return None
+    try:
+        return Codec("jpeg" if fmt == "jpg" else fmt, quality, png_level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _requested_profile(profile: Optional[str], imgsz: Optional[int], tile: Optional[int]) -> DetectProfile:
+    try:
+        return DetectProfile(profile, imgsz, tile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _rounded(entities: List[dict]) -> List[dict]:
+    # header-sized entities: sub-pixel box precision and 4-digit confidences add nothing
+    return [{"label": e["label"], "conf": round(e["conf"], 3), "bbox": [round(v, 1) for v in e["bbox"]]}
+            for e in entities]
+
+def _response_mode(accept: str) -> str:
+    if "multipart/mixed" in accept:
+        return "multipart"
+    if any(t.strip().startswith(("image/", "application/octet-stream")) for t in accept.split(",")):
+        return "binary"
+    return "json"
 
 @app.post("/v1/anonymize/image", response_model=ImgResp)
 async def img_endpoint(
+    request: Request,
     file: UploadFile = File(None),
     image_b64: Optional[str] = Form(None),
+    format: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None),
+    png_level: Optional[int] = Form(None),
+    profile: Optional[str] = Form(None),
+    imgsz: Optional[int] = Form(None),
+    tile: Optional[int] = Form(None),
 ):
+    """
+    Detection: 'profile' (default | fast | accurate, see profiles.py) with optional 'imgsz'
+    and 'tile' overrides; VISION_PROFILE etc. set the defaults.
+    Output format: 'format' (png | jpeg | webp | input), else an image type in Accept, else
+    the upload's own format; 'quality' (JPEG/WebP) and 'png_level' tune the encoder.
+    Response: JSON with base64 by default; raw image bytes for Accept: image/* or
+    application/octet-stream (entities, rounded, in the X-Entities header; a crowded frame
+    whose header would exceed VISION_ENTITIES_HEADER_MAX gets multipart/mixed instead);
+    multipart/mixed for a JSON part followed by the image part.
+    """
     # exactly one input required
     if (file is None and not image_b64) or (file is not None and image_b64):
         raise HTTPException(status_code=400, detail="Provide either 'file' or 'image_b64' (exactly one).")
 
     t0 = time.time()
+    accept = request.headers.get("accept", "")
+    codec = _requested_codec(format, quality, png_level, accept)
+    det_profile = _requested_profile(profile, imgsz, tile)
     data = await file.read() if file else base64.b64decode(image_b64)
-    try:
-        img = Image.open(io.BytesIO(data)).convert("RGB")
-    except Exception:
-        raise HTTPException(status_code=415, detail="Unsupported or corrupt image")
-
-    res = anonymize_image(img)
-    buf = io.BytesIO()
-    res["image"].save(buf, format="PNG")
+    with _admit():
+        try:
+            out, entities, codec = await asyncio.get_running_loop().run_in_executor(
+                _executor, _process_image, data, codec, det_profile)
+        except ValueError:
+            raise HTTPException(status_code=415, detail="Unsupported or corrupt image")
+    timing_ms = (time.time() - t0) * 1000.0
 
+    mode = _response_mode(accept)
+    if mode == "binary":
+        header = json.dumps(_rounded(entities), separators=(",", ":"))
+        if len(header) <= VISION_ENTITIES_HEADER_MAX:
+            return Response(out, media_type=codec.media_type, headers={
+                "X-Entities": header,
+                "X-Timing-Ms": f"{timing_ms:.1f}",
+            })
+        mode = "multipart"
+    if mode == "multipart":
+        boundary = uuid.uuid4().hex
+        meta = json.dumps({"media_type": codec.media_type, "entities": entities, "timing_ms": timing_ms})
+        body = b"".join([
+            f"--{boundary}\r\nContent-Type: application/json\r\n\r\n{meta}\r\n".encode(),
+            f"--{boundary}\r\nContent-Type: {codec.media_type}\r\n\r\n".encode(), out,
+            f"\r\n--{boundary}--\r\n".encode(),
+        ])
+        return Response(body, media_type=f"multipart/mixed; boundary={boundary}")
     return ImgResp(
-        redacted_image_b64=base64.b64encode(buf.getvalue()).decode(),
-        entities=[Entity(**e) for e in res.get("entities", [])],
-        timing_ms=(time.time() - t0) * 1000.0,
+        redacted_image_b64=base64.b64encode(out).decode(),
+        media_type=codec.media_type,
+        entities=[Entity(**e) for e in entities],
+        timing_ms=timing_ms,
     )
 
+def _check_members(count: int, size: int):
+    if count > VISION_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {VISION_BATCH_MAX_ITEMS} images per request")
+    if size > VISION_BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413,
+                            detail=f"Archive expands to more than {VISION_BATCH_MAX_BYTES >> 20} MB")
+
+def _unpack_archive(name: str, data: bytes) -> List[tuple]:
+    """
+    (member name, bytes) for every regular file in a zip or tar(.gz) upload, in archive order.
+    Member count and declared sizes are checked against the batch limits before anything is
+    decompressed; entries that are not regular files (links, devices, ...) are skipped.
+    """
+    buf = io.BytesIO(data)
+    if zipfile.is_zipfile(buf):
+        try:
+            with zipfile.ZipFile(buf) as zf:
+                infos = [i for i in zf.infolist() if not i.is_dir()]
+                _check_members(len(infos), sum(i.file_size for i in infos))
+                # ZipExtFile stops at the declared file_size, so the check above bounds the output
+                return [(i.filename, zf.read(i)) for i in infos]
+        except (zipfile.BadZipFile, zlib.error, EOFError):
+            raise HTTPException(status_code=415, detail=f"'{name}' is a corrupt zip archive")
+    buf.seek(0)
+    try:
+        with tarfile.open(fileobj=buf, mode="r:*") as tf:
+            members, entries, size = [], 0, 0
+            for m in tf:  # headers only; stop early instead of indexing a huge archive
+                entries += 1
+                if entries > 4 * VISION_BATCH_MAX_ITEMS:
+                    raise HTTPException(status_code=413, detail="Too many archive entries")
+                if m.isfile():
+                    members.append(m)
+                    size += m.size
+                    _check_members(len(members), size)
+            return [(m.name, tf.extractfile(m).read()) for m in members]
+    except tarfile.TarError:
+        raise HTTPException(status_code=415, detail=f"'{name}' is not a zip or tar archive")
+
+def _process_images(items: List[tuple], codec: Optional[Codec], profile: DetectProfile) -> List[dict]:
+    # decode everything, answer cache hits, run the remaining frames as one batch,
+    # re-assemble in input order
+    out, todo = [], []
+    for name, data in items:
+        item = {"name": name}
+        out.append(item)
+        try:
+            img = decode_image(data)
+        except ValueError:
+            item["error"] = "Unsupported or corrupt image"
+            continue
+        c = codec or Codec(sniff_format(data))
+        key = _cache.key(img, profile.tag)
+        hit = _encode_cached(img, key, c)
+        if hit is None:
+            todo.append((item, key, img, c))
+            continue
+        item["redacted_image_b64"] = base64.b64encode(hit[0]).decode()
+        item["media_type"] = c.media_type
+        item["entities"] = hit[1]
+    results = anonymize_images([img for _, _, img, _ in todo], profile)
+    for (item, key, _, c), res in zip(todo, results):
+        enc = c.encode(res["image"])
+        _cache.put(key, res["entities"], c.tag, enc)
+        item["redacted_image_b64"] = base64.b64encode(enc).decode()
+        item["media_type"] = c.media_type
+        item["entities"] = res["entities"]
+    return out
+
+@app.post("/v1/anonymize/images", response_model=BatchResp)
+async def imgs_endpoint(
+    files: List[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    format: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None),
+    png_level: Optional[int] = Form(None),
+    profile: Optional[str] = Form(None),
+    imgsz: Optional[int] = Form(None),
+    tile: Optional[int] = Form(None),
+):
+    """
+    Many images in one request: repeated multipart 'files' fields, or one zip/tar 'archive'.
+    Detection profile and output codec fields as for /v1/anonymize/image (default output:
+    each image's own format).
+    Images are detected in batched forward passes; results come back in input order, and an
+    undecodable image yields an item with 'error' set instead of failing the whole batch.
+    """
+    if (not files and archive is None) or (files and archive is not None):
+        raise HTTPException(status_code=400, detail="Provide either 'files' or 'archive' (exactly one).")
+
+    t0 = time.time()
+    codec = _requested_codec(format, quality, png_level, "")
+    det_profile = _requested_profile(profile, imgsz, tile)
+    if archive is not None and (archive.size or 0) > VISION_BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Archive exceeds {VISION_BATCH_MAX_BYTES >> 20} MB")
+    if files and len(files) > VISION_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {VISION_BATCH_MAX_ITEMS} images per request")
+
+    loop = asyncio.get_running_loop()
+    with _admit():
+        if archive is not None:
+            # decompression is CPU-bound: keep it off the event loop
+            items = await loop.run_in_executor(_executor, _unpack_archive, archive.filename or "archive",
+                                               await archive.read())
+        else:
+            items = [(f.filename or str(i), await f.read()) for i, f in enumerate(files)]
+        results = await loop.run_in_executor(_executor, _process_images, items, codec, det_profile)
+    return BatchResp(results=[BatchItem(**r) for r in results], timing_ms=(time.time() - t0) * 1000.0)
+
+async def _save_upload(chunks, path: str):
+    # write an async byte stream to disk chunk by chunk, never holding the whole upload;
+    # the file I/O runs in the threadpool so a slow disk doesn't stall the event loop
+    size = 0
+    f = await run_in_threadpool(open, path, "wb")
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > VIDEO_MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds {VIDEO_MAX_UPLOAD_BYTES >> 20} MB")
+            await run_in_threadpool(f.write, chunk)
+    finally:
+        await run_in_threadpool(f.close)
+    if not size:
+        raise HTTPException(status_code=400, detail="Empty upload")
+
+async def _upload_chunks(file: FormFile):
+    while chunk := await file.read(UPLOAD_CHUNK):
+        yield chunk
+
 @app.post("/v1/anonymize/video", response_model=VidResp)
 async def vid_endpoint(file: UploadFile = File(...)):
+    """
+    Synchronous variant, kept for existing callers; prefer POST /v1/jobs/video.
+    """
     t0 = time.time()
-    data = await file.read()
-    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp:
-        tmp.write(data)
-        tmp.flush()
-        inp = tmp.name
-    out_path, _ = anonymize_video(inp)
+    fd, inp = tempfile.mkstemp(suffix=os.path.splitext(file.filename or "")[1] or ".mp4")
+    os.close(fd)
+    try:
+        await _save_upload(_upload_chunks(file), inp)
+        out_path, _ = await run_in_threadpool(anonymize_video, inp)
+    finally:
+        os.remove(inp)
     return VidResp(redacted_video_path=out_path, timing_ms=(time.time() - t0) * 1000.0)
+
+@app.post("/v1/jobs/video", response_model=JobResp, status_code=202)
+async def create_video_job(request: Request):
+    """
+    Start an anonymization job. The body is either multipart with a 'file' field or the raw
+    video bytes (any non-multipart content type; X-Filename may carry the original name).
+    Returns as soon as the upload is on disk; poll GET /v1/jobs/{job_id} for progress.
+    """
+    if _jobs.pending() >= VIDEO_JOB_MAX_PENDING:
+        raise HTTPException(status_code=429, detail="Too many video jobs in progress, retry later",
+                            headers={"Retry-After": "30"})
+
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        file = form.get("file")
+        if not isinstance(file, FormFile):
+            raise HTTPException(status_code=400, detail="Multipart body needs a 'file' field")
+        name, chunks = file.filename, _upload_chunks(file)
+    else:
+        name, chunks = request.headers.get("x-filename"), request.stream()
+
+    job = _jobs.create(os.path.splitext(name or "")[1] or ".mp4")
+    try:
+        await _save_upload(chunks, job.input_path)
+    except BaseException as e:
+        _jobs.abandon(job, getattr(e, "detail", None) or "Upload failed")
+        raise
+    _jobs.submit(job, anonymize_video)
+    return _job_resp(job)
+
+def _get_job(job_id: str):
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+@app.get("/v1/jobs/{job_id}", response_model=JobResp)
+def get_video_job(job_id: str):
+    return _job_resp(_get_job(job_id))
+
+@app.get("/v1/jobs/{job_id}/result")
+def get_video_job_result(job_id: str):
+    # FileResponse answers Range requests (206) itself, so large results can be resumed/seeked
+    job = _get_job(job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return FileResponse(job.output_path, media_type="video/mp4", filename=f"{job.id}.mp4")
+
+@app.delete("/v1/jobs/{job_id}", status_code=204)
+def delete_video_job(job_id: str):
+    job = _get_job(job_id)
+    if not _jobs.delete(job.id):
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return Response(status_code=204)
@@ -0,0 +1,158 @@
+# prismguard_vision/backends.py
+import os, time, shutil, argparse, tempfile, importlib.util
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Tuple
+
+# VISION_BACKEND values understood by resolve_backend; "auto" times the installed fp32
+# backends at startup and keeps the fastest (int8 is opt-in: check it with parity.py --images <your frames> first)
+BACKENDS = ("torch", "onnx", "onnx-int8", "openvino", "auto")
+EXPORT_IMGSZ = 640  # trace size only: exports use dynamic batch/height/width axes
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def check_backend(name: str) -> str:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown VISION_BACKEND {name!r}; expected one of {', '.join(BACKENDS)}")
+    return name
+
+def _candidates():
+    yield "torch"
+    if _installed("onnxruntime") and _installed("onnx"):
+        yield "onnx"
+    if _installed("openvino"):
+        yield "openvino"
+
+def _fastest(model_path: Path) -> Tuple[str, Path]:
+    """
+    Time each installed fp32 backend on a blank dashcam-shaped frame; a backend whose
+    export or load fails is skipped.
+    """
+    import numpy as np
+    from .detector import Detector
+
+    frame = np.full((384, 640, 3), 114, dtype=np.uint8)
+    best = None
+    for name in _candidates():
+        try:
+            path = resolve_backend(name, model_path)[1]
+            det = Detector(path, conf=0.25)
+            det.detect(frame)  # warm-up
+        except Exception:
+            continue
+        t0 = time.perf_counter()
+        for _ in range(3):
+            det.detect(frame)
+        elapsed = time.perf_counter() - t0
+        if best is None or elapsed < best[0]:
+            best = (elapsed, name, path)
+    return best[1], best[2]
+
+def export_dir(model_path: Path) -> Path:
+    """
+    Exports are cached next to the weights (model/exports/) when that is writable, else
+    under VISION_EXPORT_DIR (default: the system temp dir).
+    """
+    local = model_path.parent / "exports"
+    try:
+        local.mkdir(exist_ok=True)
+        if os.access(local, os.W_OK):
+            return local
+    except OSError:
+        pass
+    fallback = Path(os.getenv("VISION_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "pg_vision_exports")))
+    fallback.mkdir(parents=True, exist_ok=True)
+    return fallback
+
+@contextmanager
+def _legacy_onnx_exporter():
+    # ultralytics 8.0.x drives torch.onnx.export with TorchScript-era arguments; newer torch
+    # defaults to the dynamo exporter, so pin the legacy one where the switch exists
+    import inspect, torch
+
+    orig = torch.onnx.export
+    if "dynamo" not in inspect.signature(orig).parameters:
+        yield
+        return
+    torch.onnx.export = lambda *a, **k: orig(*a, **{"dynamo": False, **k})
+    try:
+        yield
+    finally:
+        torch.onnx.export = orig
+
+def _ultralytics_export(model_path: Path, fmt: str, produced: str, target: Path) -> Path:
+    """
+    Run an ultralytics export on a private copy of the weights and move the artifact to
+    target atomically, so concurrent replicas never see a half-written export.
+    """
+    from ultralytics import YOLO
+
+    with tempfile.TemporaryDirectory(dir=target.parent) as tmp:
+        src = Path(tmp) / model_path.name
+        shutil.copy2(model_path, src)
+        with _legacy_onnx_exporter():
+            YOLO(str(src)).export(format=fmt, dynamic=True, simplify=False, imgsz=EXPORT_IMGSZ)
+        os.replace(Path(tmp) / produced.format(stem=src.stem), target)
+    return target
+
+def export_onnx(model_path: Path, cache_dir: Path) -> Path:
+    target = cache_dir / f"{model_path.stem}.onnx"
+    if target.exists():
+        return target
+    return _ultralytics_export(model_path, "onnx", "{stem}.onnx", target)
+
+def quantize_onnx(path: Path) -> Path:
+    """
+    Dynamic int8 quantization (uint8 weights, activations quantized at runtime). The model
+    metadata ultralytics reads back (names, stride, imgsz, ...) is carried over.
+    """
+    import onnx
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    out = path.with_name(path.stem + ".int8.onnx")
+    if out.exists():
+        return out
+    tmp = out.with_suffix(".tmp")
+    quantize_dynamic(str(path), str(tmp), weight_type=QuantType.QUInt8)
+    meta = {p.key: p.value for p in onnx.load(str(path), load_external_data=False).metadata_props}
+    q = onnx.load(str(tmp))
+    present = {p.key for p in q.metadata_props}
+    for k, v in meta.items():
+        if k not in present:
+            entry = q.metadata_props.add()
+            entry.key, entry.value = k, v
+    onnx.save(q, str(tmp))
+    os.replace(tmp, out)
+    return out
+
+def export_openvino(model_path: Path, cache_dir: Path) -> Path:
+    target = cache_dir / f"{model_path.stem}_openvino_model"
+    if target.exists():
+        return target
+    return _ultralytics_export(model_path, "openvino", "{stem}_openvino_model", target)
+
+def resolve_backend(name: str, model_path: Path) -> Tuple[str, Path]:
+    """
+    (backend, path ultralytics should load) for a VISION_BACKEND value, exporting on first use.
+    """
+    if check_backend(name) == "auto":
+        return _fastest(model_path)
+    if name == "torch":
+        return name, model_path
+    cache_dir = export_dir(model_path)
+    if name == "onnx":
+        return name, export_onnx(model_path, cache_dir)
+    if name == "onnx-int8":
+        return name, quantize_onnx(export_onnx(model_path, cache_dir))
+    return name, export_openvino(model_path, cache_dir)
+
+if __name__ == "__main__":
+    # pre-build exports at image build time so replicas don't pay for them on cold start:
+    #   python -m prismguard_vision.backends --backend onnx
+    from .wrapper import MODEL_PATH
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backend", default=os.getenv("VISION_BACKEND", "auto"), choices=BACKENDS)
+    args = ap.parse_args()
+    print(*resolve_backend(args.backend, MODEL_PATH))
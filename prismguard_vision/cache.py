@@ -0,0 +1,209 @@
+# prismguard_vision/cache.py
+import os, json, hashlib, threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+Entities = List[Dict[str, Any]]
+
+# rough per-entry cost: digest key + OrderedDict node + dict/list headers
+_ENTRY_OVERHEAD = 256
+_ENTITY_BYTES = 160
+
+class ResultCache:
+    """
+    Byte-bounded LRU of detection results keyed by a digest of the decoded pixels and the
+    detector/obfuscation config (revision). An entry holds the entities and, optionally,
+    encoded redacted outputs per format. With spill_dir set, entries evicted from memory are
+    written there (itself bounded by spill_max_bytes, oldest first) and promoted back on a hit.
+    """
+
+    def __init__(self, revision: str, max_bytes: int, store_output: bool = True,
+                 spill_dir: Optional[str] = None, spill_max_bytes: int = 0):
+        self.revision = revision
+        self.max_bytes = max(0, max_bytes)
+        self.store_output = store_output
+        self.spill_dir = spill_dir if spill_dir and spill_max_bytes > 0 else None
+        self.spill_max_bytes = spill_max_bytes
+        self._data: "OrderedDict[bytes, Tuple[Entities, Dict[str, bytes]]]" = OrderedDict()
+        self._bytes = 0
+        self._disk: "OrderedDict[bytes, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = self.evictions = 0
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._index_spill()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, image: np.ndarray, variant: str = "") -> bytes:
+        h = hashlib.blake2b(digest_size=32)
+        h.update(self.revision.encode())
+        h.update(variant.encode())
+        h.update(f"|{image.shape}|{image.dtype}|".encode())
+        h.update(np.ascontiguousarray(image).data)
+        return h.digest()
+
+    @staticmethod
+    def _size(entities: Entities, outputs: Dict[str, bytes]) -> int:
+        return _ENTRY_OVERHEAD + _ENTITY_BYTES * len(entities) + sum(len(v) for v in outputs.values())
+
+    def get(self, key: bytes, fmt: Optional[str] = None) -> Optional[Tuple[Entities, Optional[bytes]]]:
+        """
+        (entities, encoded output for fmt or None) on a hit, None on a miss.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+        if item is None:
+            item = self._load_spilled(key)
+            if item is None:
+                with self._lock:
+                    self.misses += 1
+                return None
+            with self._lock:
+                self.disk_hits += 1
+            self._insert(key, *item)
+        entities, outputs = item
+        return [dict(e) for e in entities], outputs.get(fmt) if fmt else None
+
+    def put(self, key: bytes, entities: Entities, fmt: Optional[str] = None, encoded: Optional[bytes] = None):
+        if not self.enabled:
+            return
+        entities = [{"label": e["label"], "conf": e["conf"], "bbox": list(e["bbox"])} for e in entities]
+        with self._lock:
+            old = self._data.get(key)
+        outputs = dict(old[1]) if old else {}
+        if fmt and encoded is not None and self.store_output:
+            outputs[fmt] = encoded
+        self._insert(key, entities, outputs)
+
+    def _insert(self, key: bytes, entities: Entities, outputs: Dict[str, bytes]):
+        size = self._size(entities, outputs)
+        if size > self.max_bytes:
+            return
+        evicted = []
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (entities, outputs)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                k = next(iter(self._data))
+                evicted.append((k, self._data[k]))
+                self._drop(k)
+                self.evictions += 1
+        for k, item in evicted:
+            self._spill(k, *item)
+
+    def _drop(self, key: bytes):
+        entities, outputs = self._data.pop(key)
+        self._bytes -= self._size(entities, outputs)
+
+    # --- disk spill: <hex>.json ({entities, formats}) + <hex><fmt> per encoded output
+
+    def _stem(self, key: bytes) -> str:
+        return os.path.join(self.spill_dir, key.hex())
+
+    def _index_spill(self):
+        # pick up what a previous process left behind, oldest first
+        sizes: Dict[str, int] = {}
+        mtimes: Dict[str, float] = {}
+        for e in os.scandir(self.spill_dir):
+            stem, _, ext = e.name.partition(".")
+            st = e.stat()
+            sizes[stem] = sizes.get(stem, 0) + st.st_size
+            if ext == "json":
+                mtimes[stem] = st.st_mtime
+        for stem in sorted(mtimes, key=mtimes.get):
+            self._disk[bytes.fromhex(stem)] = sizes[stem]
+            self._disk_bytes += sizes[stem]
+
+    def _spill(self, key: bytes, entities: Entities, outputs: Dict[str, bytes]):
+        if not self.spill_dir:
+            return
+        stem = self._stem(key)
+        try:
+            size = 0
+            for fmt, data in outputs.items():
+                with open(stem + fmt, "wb") as f:
+                    f.write(data)
+                size += len(data)
+            # the .json is written last: its presence marks a complete entry
+            blob = json.dumps({"entities": entities, "formats": list(outputs)}).encode()
+            with open(stem + ".json.tmp", "wb") as f:
+                f.write(blob)
+            os.replace(stem + ".json.tmp", stem + ".json")
+            size += len(blob)
+        except OSError:
+            return
+        stale = []
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = size
+            self._disk_bytes += size
+            while self._disk_bytes > self.spill_max_bytes and self._disk:
+                k, s = self._disk.popitem(last=False)
+                self._disk_bytes -= s
+                stale.append(k)
+        for k in stale:
+            self._unlink(k)
+
+    def _load_spilled(self, key: bytes) -> Optional[Tuple[Entities, Dict[str, bytes]]]:
+        if not self.spill_dir:
+            return None
+        with self._lock:
+            if key not in self._disk:
+                return None
+            self._disk_bytes -= self._disk.pop(key)
+        stem = self._stem(key)
+        try:
+            with open(stem + ".json", "rb") as f:
+                meta = json.loads(f.read())
+            outputs = {}
+            for fmt in meta["formats"]:
+                with open(stem + fmt, "rb") as f:
+                    outputs[fmt] = f.read()
+            item = (meta["entities"], outputs)
+        except (OSError, ValueError, KeyError):
+            item = None
+        self._unlink(key)
+        return item
+
+    def _unlink(self, key: bytes):
+        stem = self._stem(key)
+        try:
+            with open(stem + ".json", "rb") as f:
+                formats = json.loads(f.read()).get("formats", [])
+        except (OSError, ValueError):
+            formats = []
+        for p in [stem + fmt for fmt in formats] + [stem + ".json"]:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "spilled_entries": len(self._disk),
+                "spilled_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+            }
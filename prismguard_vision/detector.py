@@ -0,0 +1,76 @@
+# prismguard_vision/detector.py
+import os, queue, threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Iterator, Optional
+
+import numpy as np
+
+class Detector:
+    """
+    YOLO model loaded once and kept resident for the life of the process. model_path is the
+    .pt weights or an exported artifact (see backends.py); ultralytics picks the runtime.
+    Ultralytics predictors keep per-call state, so calls are serialised with a lock.
+    """
+
+    def __init__(self, model_path: Path, conf: float, device: str = "cpu"):
+        from ultralytics import YOLO  # heavy import, only when a detector is actually built
+
+        self.model = YOLO(str(model_path), task="detect")
+        self.conf = conf
+        self.device = device
+        self._lock = threading.Lock()
+
+    def detect(self, image_bgr: np.ndarray, imgsz: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Run the detector on one BGR frame. Returns entities {label, conf, bbox=[x1,y1,x2,y2]}
+        in pixel coordinates of the input.
+        """
+        return self.detect_batch([image_bgr], imgsz)[0]
+
+    def detect_batch(self, images_bgr: List[np.ndarray], imgsz: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        One forward pass over several BGR frames (any sizes; ultralytics letterboxes them
+        to a common input size, imgsz if given). Returns one entity list per frame, in order.
+        """
+        if not images_bgr:
+            return []
+        kwargs = {"imgsz": imgsz} if imgsz else {}
+        with self._lock:
+            results = self.model.predict(list(images_bgr), conf=self.conf, device=self.device, verbose=False, **kwargs)
+        return [self._entities(r) for r in results]
+
+    def _entities(self, res) -> List[Dict[str, Any]]:
+        boxes = res.boxes
+        xyxy = boxes.xyxy.cpu().numpy()
+        confs = boxes.conf.cpu().numpy()
+        classes = boxes.cls.cpu().numpy().astype(int)
+        names = res.names or {}  # exported backends only know their class names after loading
+        return [
+            {"label": str(names.get(c, c)), "conf": float(p), "bbox": [float(v) for v in box]}
+            for box, p, c in zip(xyxy, confs, classes)
+        ]
+
+class DetectorPool:
+    """
+    Fixed set of independent Detector instances, one per worker, so requests running in
+    parallel never share predictor state. lease() blocks until an instance is free.
+    """
+
+    def __init__(self, model_path: Path, conf: float, size: int, device: str = "cpu"):
+        import torch
+
+        self.size = max(1, size)
+        # split the cores between workers instead of letting each oversubscribe them
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // self.size))
+        self._free: "queue.Queue[Detector]" = queue.Queue()
+        for _ in range(self.size):
+            self._free.put(Detector(model_path, conf=conf, device=device))
+
+    @contextmanager
+    def lease(self) -> Iterator[Detector]:
+        det = self._free.get()
+        try:
+            yield det
+        finally:
+            self._free.put(det)
@@ -0,0 +1,149 @@
+# prismguard_vision/jobs.py
+import os, time, uuid, shutil, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+class Job:
+    def __init__(self, job_id: str, job_dir: str, input_path: str):
+        self.id = job_id
+        self.dir = job_dir
+        self.input_path = input_path
+        self.status = "queued"  # queued -> running -> done | failed
+        self.frames_done = 0
+        self.frames_total = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.output_path: Optional[str] = None
+        self.error: Optional[str] = None
+
+    @property
+    def fps(self) -> float:
+        if not self.started or not self.frames_done:
+            return 0.0
+        return self.frames_done / max(1e-6, (self.finished or time.time()) - self.started)
+
+    def view(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "frames_done": self.frames_done,
+            "frames_total": self.frames_total,
+            "fps": round(self.fps, 2),
+            "error": self.error,
+        }
+
+def _last_modified(path: str) -> float:
+    # newest mtime of a job directory and anything in it; 0 if it is already gone
+    latest = 0.0
+    for dirpath, _, files in os.walk(path):
+        for p in [dirpath] + [os.path.join(dirpath, f) for f in files]:
+            try:
+                latest = max(latest, os.stat(p).st_mtime)
+            except OSError:
+                pass
+    return latest
+
+class JobStore:
+    """
+    Video jobs processed on a bounded background executor. Each job owns a directory under
+    root holding its upload and its output; finished jobs (and their files) are dropped
+    ttl_s after completion. State is in-process only, so jobs don't survive a restart; job
+    directories left in root by an earlier process are removed once nothing in them has
+    changed for ttl_s (root may be shared with sibling workers whose jobs are still live).
+    """
+
+    def __init__(self, root: str, workers: int, ttl_s: float, max_pending: int):
+        self.root = root
+        self.ttl_s = ttl_s
+        self.max_pending = max_pending
+        os.makedirs(root, exist_ok=True)
+        self._jobs: Dict[str, Job] = {}
+        self._orphans = [e.path for e in os.scandir(root) if e.is_dir(follow_symlinks=False)]
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="pg-vid-job")
+
+    def create(self, suffix: str) -> Job:
+        """
+        Register a job and its directory; the caller writes the upload to job.input_path
+        and then calls submit().
+        """
+        self._expire()
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.root, job_id)
+        os.makedirs(job_dir)
+        job = Job(job_id, job_dir, os.path.join(job_dir, "source" + suffix))
+        with self._lock:
+            self._jobs[job_id] = job
+        return job
+
+    def abandon(self, job: Job, error: str):
+        # upload never completed: mark it failed so it expires like any other job
+        job.status, job.error, job.finished = "failed", error, time.time()
+        try:
+            os.remove(job.input_path)
+        except OSError:
+            pass
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(j.status in ("queued", "running") for j in self._jobs.values())
+
+    def submit(self, job: Job, run: Callable[[str, str, Callable[[int, int], None]], Tuple[str, dict]]):
+        """
+        Queue run(input_path, out_dir, progress) -> (output_path, meta) for the job.
+        """
+        self._executor.submit(self._run, job, run)
+
+    def _run(self, job: Job, run):
+        job.status, job.started = "running", time.time()
+
+        def progress(done: int, total: int):
+            job.frames_done, job.frames_total = done, total
+
+        try:
+            out_dir = os.path.join(job.dir, "out")
+            os.makedirs(out_dir, exist_ok=True)
+            job.output_path, _ = run(job.input_path, out_dir, progress)
+            job.status = "done"
+        except Exception as e:
+            job.status, job.error = "failed", str(e) or type(e).__name__
+        finally:
+            job.finished = time.time()
+            try:
+                os.remove(job.input_path)
+            except OSError:
+                pass
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in ("queued", "running"):
+                return False
+            del self._jobs[job_id]
+        shutil.rmtree(job.dir, ignore_errors=True)
+        return True
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            stale = [j for j in self._jobs.values() if j.finished and now - j.finished > self.ttl_s]
+            for j in stale:
+                del self._jobs[j.id]
+        for j in stale:
+            shutil.rmtree(j.dir, ignore_errors=True)
+        with self._lock:
+            orphans = list(self._orphans)
+        gone = [p for p in orphans if now - _last_modified(p) > self.ttl_s]
+        if gone:
+            with self._lock:
+                self._orphans = [p for p in self._orphans if p not in gone]
+            for path in gone:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,92 @@
+# prismguard_vision/keyframe_report.py
+"""
+Recall/cost trade-off of keyframe mode against running the detector on every frame.
+
+    python -m prismguard_vision.keyframe_report clip.mp4 [--intervals 3 5 10] [--margin 0.15]
+
+Full per-frame detection is the reference. A reference box counts as recalled when the
+keyframe-mode boxes of that frame cover at least --cover of its area (what matters for
+blurring); IoU>=0.5 recall is reported alongside. The last columns count how gaps
+between keyframes were bridged: pairs matched by overlap, by distance (objects moving
+more than their own size), hulls over pairs too far apart to match, and held boxes.
+"""
+import time, argparse
+from typing import List
+
+import cv2
+import numpy as np
+
+from .tracking import iou, propagate
+from .wrapper import get_pool, VIDEO_BOX_MARGIN, VIDEO_SCENE_THRESHOLD, VIDEO_MAX_SPEED
+
+def _read(path: str) -> List[np.ndarray]:
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video {path}")
+    frames = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def _covered(ref: List[float], boxes: List[List[float]], shape) -> float:
+    x1, y1 = max(0, int(ref[0])), max(0, int(ref[1]))
+    x2, y2 = min(shape[1], int(ref[2])), min(shape[0], int(ref[3]))
+    if x2 <= x1 or y2 <= y1:
+        return 1.0
+    mask = np.zeros((y2 - y1, x2 - x1), dtype=bool)
+    for b in boxes:
+        bx1, by1 = max(x1, int(b[0])), max(y1, int(b[1]))
+        bx2, by2 = min(x2, int(b[2])), min(y2, int(b[3]))
+        if bx2 > bx1 and by2 > by1:
+            mask[by1 - y1:by2 - y1, bx1 - x1:bx2 - x1] = True
+    return float(mask.mean())
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("video")
+    ap.add_argument("--intervals", type=int, nargs="+", default=[3, 5, 10])
+    ap.add_argument("--margin", type=float, default=VIDEO_BOX_MARGIN)
+    ap.add_argument("--scene-threshold", type=float, default=VIDEO_SCENE_THRESHOLD)
+    ap.add_argument("--max-speed", type=float, default=VIDEO_MAX_SPEED)
+    ap.add_argument("--cover", type=float, default=0.9)
+    args = ap.parse_args()
+
+    frames = _read(args.video)
+    with get_pool().lease() as det:
+        t0 = time.perf_counter()
+        reference = [[e["bbox"] for e in det.detect(f)] for f in frames]
+        full_s = time.perf_counter() - t0
+        n_ref = sum(len(r) for r in reference)
+        print(f"{len(frames)} frames, {n_ref} reference boxes, full detection {full_s:.2f}s")
+        print(f"{'N':>4} {'calls':>6} {'speedup':>8} {'cover-recall':>13} {'iou-recall':>11} "
+              f"{'iou':>6} {'jump':>6} {'hull':>6} {'held':>6}")
+
+        for n in args.intervals:
+            calls = 0
+            stats = {}
+
+            def detect(frame):
+                nonlocal calls
+                calls += 1
+                return det.detect(frame)
+
+            t0 = time.perf_counter()
+            got = [boxes for _, boxes in propagate(iter(frames), detect, n, args.margin,
+                                                          args.scene_threshold, args.max_speed, stats)]
+            elapsed = time.perf_counter() - t0
+            covered = hit = 0
+            for f, ref, boxes in zip(frames, reference, got):
+                for r in ref:
+                    covered += _covered(r, boxes, f.shape) >= args.cover
+                    hit += any(iou(r, b) >= 0.5 for b in boxes)
+            denom = max(1, n_ref)
+            print(f"{n:>4} {calls:>6} {full_s / max(elapsed, 1e-9):>7.1f}x "
+                  f"{covered / denom:>13.3f} {hit / denom:>11.3f} "
+                  + " ".join(f"{stats.get(k, 0):>6}" for k in ("iou", "jump", "hull", "held")))
+
+if __name__ == "__main__":
+    main()
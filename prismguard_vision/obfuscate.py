@@ -0,0 +1,112 @@
+# prismguard_vision/obfuscate.py
+import os
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+# gaussian | box | downscale | pixelate | fill
+OBFUSCATION_METHOD = os.getenv("OBFUSCATION_METHOD", "box")
+FILL_COLOR = tuple(int(c) for c in os.getenv("OBFUSCATION_FILL_BGR", "0,0,0").split(","))
+
+def _odd(k: int) -> int:
+    return max(1, k if k % 2 else k + 1)
+
+def _gaussian(roi: np.ndarray, strength: int) -> np.ndarray:
+    k = _odd(strength)
+    return cv2.GaussianBlur(roi, (k, k), 0)
+
+def _box(roi: np.ndarray, strength: int) -> np.ndarray:
+    # separable running-sum filter: cost per pixel is independent of the kernel size
+    k = _odd(strength)
+    return cv2.blur(roi, (k, k))
+
+def _downscale(roi: np.ndarray, strength: int) -> np.ndarray:
+    # area-average down by strength/4, bilinear back up: a blur for a fraction of the work
+    f = max(2, strength // 4)
+    h, w = roi.shape[:2]
+    small = cv2.resize(roi, (max(1, w // f), max(1, h // f)), interpolation=cv2.INTER_AREA)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+def _pixelate(roi: np.ndarray, strength: int) -> np.ndarray:
+    f = max(2, strength // 3)
+    h, w = roi.shape[:2]
+    small = cv2.resize(roi, (max(1, w // f), max(1, h // f)), interpolation=cv2.INTER_AREA)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
+
+def _fill(roi: np.ndarray, strength: int) -> np.ndarray:
+    out = np.empty_like(roi)
+    out[:] = FILL_COLOR[:roi.shape[2]] if roi.ndim == 3 else FILL_COLOR[0]
+    return out
+
+METHODS: Dict[str, Callable[[np.ndarray, int], np.ndarray]] = {
+    "gaussian": _gaussian,
+    "box": _box,
+    "downscale": _downscale,
+    "pixelate": _pixelate,
+    "fill": _fill,
+}
+
+def _clamp(regions: List[List[float]], w: int, h: int) -> np.ndarray:
+    if not len(regions):
+        return np.empty((0, 4), dtype=np.int64)
+    b = np.asarray(regions, dtype=np.float64).reshape(-1, 4).astype(np.int64)
+    b[:, 0::2] = np.clip(b[:, 0::2], 0, w)
+    b[:, 1::2] = np.clip(b[:, 1::2], 0, h)
+    return b[(b[:, 2] > b[:, 0]) & (b[:, 3] > b[:, 1])]
+
+def _groups(b: np.ndarray) -> List[np.ndarray]:
+    """
+    Connected components of the overlap graph: each group of boxes is obfuscated once,
+    over its bounding rectangle, so overlapping pixels are never processed twice.
+    """
+    n = len(b)
+    overlap = ((b[:, None, 0] < b[None, :, 2]) & (b[None, :, 0] < b[:, None, 2])
+               & (b[:, None, 1] < b[None, :, 3]) & (b[None, :, 1] < b[:, None, 3]))
+    label = np.arange(n)
+    while True:
+        # propagate the smallest label through overlapping boxes until stable
+        nxt = np.where(overlap, label[None, :], n).min(axis=1)
+        nxt = np.minimum(nxt, label)
+        if np.array_equal(nxt, label):
+            break
+        label = nxt
+    return [np.flatnonzero(label == g) for g in np.unique(label)]
+
+def obfuscate(image: np.ndarray, regions: List[List[float]], strength: int,
+              method: str = OBFUSCATION_METHOD) -> np.ndarray:
+    """
+    Obfuscate the union of the [x1, y1, x2, y2] regions of a BGR image in place.
+    Coordinates are clamped once and overlapping boxes are merged into groups so no pixel
+    is obfuscated twice. strength is the kernel size in pixels (block size scales from it for
+    downscale/pixelate; ignored by fill). Returns the same array.
+    """
+    fn = METHODS.get(method)
+    if fn is None:
+        raise ValueError(f"Unknown obfuscation method {method!r}; expected one of {', '.join(METHODS)}")
+    h, w = image.shape[:2]
+    boxes = _clamp(regions, w, h)
+    if not len(boxes):
+        return image
+    for idx in _groups(boxes):
+        g = boxes[idx]
+        x1, y1 = g[:, 0].min(), g[:, 1].min()
+        x2, y2 = g[:, 2].max(), g[:, 3].max()
+        roi = image[y1:y2, x1:x2]
+        area = ((g[:, 2] - g[:, 0]) * (g[:, 3] - g[:, 1])).sum()
+        if (x2 - x1) * (y2 - y1) <= 1.5 * area:
+            # compact group: one pass over its bounding rectangle, copied back box by box
+            out = fn(roi, strength)
+            if len(g) == 1:
+                roi[:] = out
+                continue
+        else:
+            # sprawling chain of boxes: each box from the untouched pixels, so overlaps
+            # are never obfuscated twice and the empty space between them is skipped
+            src = roi.copy()
+            out = np.empty_like(src)
+            for bx1, by1, bx2, by2 in g - [x1, y1, x1, y1]:
+                out[by1:by2, bx1:bx2] = fn(src[by1:by2, bx1:bx2], strength)
+        for bx1, by1, bx2, by2 in g - [x1, y1, x1, y1]:
+            roi[by1:by2, bx1:bx2] = out[by1:by2, bx1:bx2]
+    return image
@@ -0,0 +1,84 @@
+# prismguard_vision/parity.py
+"""
+Check that exported detector backends find the same boxes as the PyTorch weights on a
+reference image set, and report per-image latency for each.
+
+    python -m prismguard_vision.parity --images dir_or_files ... [--backends onnx onnx-int8]
+
+--images is required: use frames from your own traffic (dashcam stills with faces and plates)
+so the gate measures what matters in production. test/ only has a single sample frame,
+enough for a smoke run (--images prismguard_vision/test) but not as an int8 gate.
+
+A torch box counts as found when a backend box of the same label overlaps it with
+IoU >= --match-iou. Exits non-zero if any backend's recall is below --min-recall or its
+mean IoU over found boxes is below --min-iou.
+"""
+import sys, time, argparse
+from pathlib import Path
+from typing import List
+
+import cv2
+
+from .backends import BACKENDS, resolve_backend
+from .detector import Detector
+from .tracking import iou
+from .wrapper import MODEL_PATH, DETECTION_CONF
+
+def _images(paths: List[str]) -> List[Path]:
+    files = []
+    for p in map(Path, paths):
+        files.extend(sorted(f for f in p.iterdir() if f.suffix.lower() in (".png", ".jpg", ".jpeg", ".webp"))
+                     if p.is_dir() else [p])
+    return files
+
+def _run(det: Detector, frames) -> tuple:
+    det.detect(frames[0])  # warm-up
+    t0 = time.perf_counter()
+    out = [det.detect(f) for f in frames]
+    return out, (time.perf_counter() - t0) / len(frames) * 1000.0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"],
+                    choices=[b for b in BACKENDS if b not in ("torch", "auto")])
+    ap.add_argument("--images", nargs="+", required=True, help="reference images or directories of them")
+    ap.add_argument("--conf", type=float, default=DETECTION_CONF)
+    ap.add_argument("--match-iou", type=float, default=0.5)
+    ap.add_argument("--min-recall", type=float, default=0.95)
+    ap.add_argument("--min-iou", type=float, default=0.9)
+    args = ap.parse_args()
+
+    frames = [cv2.imread(str(f)) for f in _images(args.images)]
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        raise SystemExit(f"No readable images in {' '.join(args.images)}")
+
+    ref, ref_ms = _run(Detector(MODEL_PATH, conf=args.conf), frames)
+    n_ref = sum(len(r) for r in ref)
+    print(f"{len(frames)} images, {n_ref} torch boxes, torch {ref_ms:.1f} ms/img")
+
+    failed = False
+    for name in args.backends:
+        _, path = resolve_backend(name, MODEL_PATH)
+        got, ms = _run(Detector(path, conf=args.conf), frames)
+        found, ious, n_got = 0, [], 0
+        for want, have in zip(ref, got):
+            n_got += len(have)
+            free = list(have)
+            for w in want:
+                best = max(((iou(w["bbox"], h["bbox"]), h) for h in free if h["label"] == w["label"]),
+                           key=lambda t: t[0], default=(0.0, None))
+                if best[0] >= args.match_iou:
+                    found += 1
+                    ious.append(best[0])
+                    free.remove(best[1])
+        recall = found / n_ref if n_ref else 1.0
+        mean_iou = sum(ious) / len(ious) if ious else (1.0 if not n_ref else 0.0)
+        ok = recall >= args.min_recall and mean_iou >= args.min_iou
+        failed |= not ok
+        print(f"{name:>10}  boxes={n_got:>5}  recall={recall:.3f}  mean_iou={mean_iou:.3f}  "
+              f"{ms:7.1f} ms/img  speedup={ref_ms / max(ms, 1e-9):4.1f}x  {'OK' if ok else 'FAIL'}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
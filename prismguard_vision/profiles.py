@@ -0,0 +1,134 @@
+# prismguard_vision/profiles.py
+import os
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+Entities = List[Dict[str, Any]]
+
+# default | fast | accurate; each request may override profile, imgsz and tile
+VISION_PROFILE = os.getenv("VISION_PROFILE", "default")
+VISION_IMGSZ = int(os.getenv("VISION_IMGSZ", "640"))  # network input size for default/accurate
+VISION_FAST_IMGSZ = int(os.getenv("VISION_FAST_IMGSZ", "416"))  # long side of the copy "fast" detects on
+VISION_TILE = int(os.getenv("VISION_TILE", "640"))  # tile side for "accurate"
+VISION_TILE_OVERLAP = float(os.getenv("VISION_TILE_OVERLAP", "0.2"))
+NMS_IOU = float(os.getenv("VISION_NMS_IOU", "0.5"))
+# bounds on per-request overrides: one request must not be able to exhaust memory or workers
+VISION_IMGSZ_MIN = int(os.getenv("VISION_IMGSZ_MIN", "128"))
+VISION_IMGSZ_MAX = int(os.getenv("VISION_IMGSZ_MAX", "1280"))
+VISION_TILE_MIN = int(os.getenv("VISION_TILE_MIN", "320"))  # tiles smaller than half the model input add passes, not pixels
+VISION_TILE_MAX = int(os.getenv("VISION_TILE_MAX", str(VISION_IMGSZ_MAX)))
+VISION_MAX_TILES = int(os.getenv("VISION_MAX_TILES", "48"))  # per image; larger images get larger tiles
+
+PROFILES = ("default", "fast", "accurate")
+
+class DetectProfile:
+    """
+    How an image is fed to the detector:
+      default  - whole image, letterboxed to imgsz
+      fast     - detect on a copy downscaled to imgsz on its long side, boxes mapped back
+      accurate - overlapping tile x tile slices plus one whole-image pass, merged with
+                 per-class NMS, so small objects in large photos keep their pixels
+    """
+
+    def __init__(self, name: Optional[str] = None, imgsz: Optional[int] = None, tile: Optional[int] = None):
+        name = name or VISION_PROFILE
+        if name not in PROFILES:
+            raise ValueError(f"Unknown detection profile {name!r}; expected one of {', '.join(PROFILES)}")
+        if imgsz is not None and not VISION_IMGSZ_MIN <= imgsz <= VISION_IMGSZ_MAX:
+            raise ValueError(f"imgsz must be between {VISION_IMGSZ_MIN} and {VISION_IMGSZ_MAX}")
+        if tile is not None and not VISION_TILE_MIN <= tile <= VISION_TILE_MAX:
+            raise ValueError(f"tile must be between {VISION_TILE_MIN} and {VISION_TILE_MAX}")
+        self.name = name
+        self.imgsz = _stride(imgsz or (VISION_FAST_IMGSZ if name == "fast" else VISION_IMGSZ))
+        self.tile = tile or VISION_TILE
+        self.tag = f"{name}:{self.imgsz}:{self.tile if name == 'accurate' else ''}"
+
+def _stride(n: int) -> int:
+    # YOLO input sizes must be multiples of 32
+    return max(32, (int(n) + 31) // 32 * 32)
+
+def _scale(ents: Entities, sx: float, sy: float, dx: float = 0.0, dy: float = 0.0) -> Entities:
+    for e in ents:
+        x1, y1, x2, y2 = e["bbox"]
+        e["bbox"] = [x1 * sx + dx, y1 * sy + dy, x2 * sx + dx, y2 * sy + dy]
+    return ents
+
+def _tiles(length: int, tile: int, overlap: float) -> List[int]:
+    if length <= tile:
+        return [0]
+    step = max(1, int(tile * (1 - overlap)))
+    starts = list(range(0, length - tile, step))
+    return starts + [length - tile]
+
+def nms(ents: Entities, iou: float) -> Entities:
+    """
+    Per-class greedy NMS over entities from overlapping tiles, highest confidence first.
+    """
+    if len(ents) < 2:
+        return ents
+    boxes = np.array([e["bbox"] for e in ents], dtype=np.float64)
+    confs = np.array([e["conf"] for e in ents])
+    labels = np.array([e["label"] for e in ents])
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    order = np.argsort(-confs)
+    suppressed = np.zeros(len(ents), dtype=bool)
+    for i in order:
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        ix = np.clip(np.minimum(boxes[i, 2], boxes[:, 2]) - np.maximum(boxes[i, 0], boxes[:, 0]), 0, None)
+        iy = np.clip(np.minimum(boxes[i, 3], boxes[:, 3]) - np.maximum(boxes[i, 1], boxes[:, 1]), 0, None)
+        inter = ix * iy
+        overlap = inter / np.maximum(area[i] + area - inter, 1e-9)
+        suppressed |= (overlap > iou) & (labels == labels[i])
+    return [ents[i] for i in sorted(keep)]
+
+def detect_images(detector, images: List[np.ndarray], profile: DetectProfile, batch_size: int) -> List[Entities]:
+    """
+    Entities per image (full-resolution pixel coordinates) under the given profile.
+    """
+    if profile.name == "default":
+        out: List[Entities] = []
+        for i in range(0, len(images), batch_size):
+            out.extend(detector.detect_batch(images[i:i + batch_size], imgsz=profile.imgsz))
+        return out
+
+    if profile.name == "fast":
+        small, scales = [], []
+        for img in images:
+            h, w = img.shape[:2]
+            f = min(1.0, profile.imgsz / max(h, w))
+            small.append(cv2.resize(img, (max(1, round(w * f)), max(1, round(h * f))),
+                                    interpolation=cv2.INTER_AREA) if f < 1.0 else img)
+            scales.append((w / small[-1].shape[1], h / small[-1].shape[0]))
+        out = []
+        for i in range(0, len(small), batch_size):
+            out.extend(detector.detect_batch(small[i:i + batch_size], imgsz=profile.imgsz))
+        return [_scale(ents, sx, sy) for ents, (sx, sy) in zip(out, scales)]
+
+    # accurate: tiles of each image go through the detector as batches
+    results = []
+    for img in images:
+        h, w = img.shape[:2]
+        tile = profile.tile
+        while len(_tiles(h, tile, VISION_TILE_OVERLAP)) * len(_tiles(w, tile, VISION_TILE_OVERLAP)) > VISION_MAX_TILES:
+            tile = int(tile * 1.25)  # cap passes per image on very large photos
+        crops, offsets = [], []
+        for y in _tiles(h, tile, VISION_TILE_OVERLAP):
+            for x in _tiles(w, tile, VISION_TILE_OVERLAP):
+                crops.append(img[y:y + tile, x:x + tile])
+                offsets.append((x, y))
+        ents = []
+        if len(crops) > 1:
+            found = []
+            for i in range(0, len(crops), batch_size):
+                found.extend(detector.detect_batch(crops[i:i + batch_size], imgsz=min(_stride(tile), _stride(VISION_IMGSZ_MAX))))
+            for e, (x, y) in zip(found, offsets):
+                ents.extend(_scale(e, 1.0, 1.0, x, y))
+        # whole-image pass for objects larger than a tile
+        ents.extend(detector.detect_batch([img], imgsz=profile.imgsz)[0])
+        results.append(nms(ents, NMS_IOU))
+    return results
@@ -0,0 +1,140 @@
+# prismguard_vision/tracking.py
+import math
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+Entity = Dict[str, Any]
+Box = List[float]
+
+def iou(a: Box, b: Box) -> float:
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def pad_box(box: Box, margin: float) -> Box:
+    # grow by `margin` of the box size on every side
+    x1, y1, x2, y2 = box
+    dx, dy = (x2 - x1) * margin, (y2 - y1) * margin
+    return [x1 - dx, y1 - dy, x2 + dx, y2 + dy]
+
+def jump(a: Box, b: Box) -> float:
+    # centre distance in units of the two boxes' mean size (longer side)
+    size = (max(a[2] - a[0], a[3] - a[1]) + max(b[2] - b[0], b[3] - b[1])) / 2
+    dx = (a[0] + a[2] - b[0] - b[2]) / 2
+    dy = (a[1] + a[3] - b[1] - b[3]) / 2
+    return math.hypot(dx, dy) / max(size, 1.0)
+
+def hull(a: Box, b: Box) -> Box:
+    return [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+def match(prev: List[Entity], nxt: List[Entity], max_jump: float = 0.0) -> Tuple[List[Tuple[int, int]], List[int], List[int]]:
+    """
+    Greedy same-label matching by IoU (highest first), then of the leftovers by centre
+    distance (nearest first) when it is at most max_jump box sizes: an object that moved
+    further than its own size between keyframes no longer overlaps itself. Returns
+    (pairs, unmatched prev indices, unmatched next indices).
+    """
+    same = [(i, j) for i, a in enumerate(prev) for j, b in enumerate(nxt) if a["label"] == b["label"]]
+    used_i, used_j, pairs = set(), set(), []
+    by_iou = sorted(((iou(prev[i]["bbox"], nxt[j]["bbox"]), i, j) for i, j in same), reverse=True)
+    by_jump = sorted((jump(prev[i]["bbox"], nxt[j]["bbox"]), i, j) for i, j in same) if max_jump > 0 else []
+    for score, i, j in by_iou:
+        if score <= 0:
+            break
+        if i in used_i or j in used_j:
+            continue
+        used_i.add(i)
+        used_j.add(j)
+        pairs.append((i, j))
+    for dist, i, j in by_jump:
+        if dist > max_jump:
+            break
+        if i in used_i or j in used_j:
+            continue
+        used_i.add(i)
+        used_j.add(j)
+        pairs.append((i, j))
+    return (pairs,
+            [i for i in range(len(prev)) if i not in used_i],
+            [j for j in range(len(nxt)) if j not in used_j])
+
+def interpolate(prev: List[Entity], nxt: Optional[List[Entity]], steps: int, margin: float,
+                max_speed: float = 0.0, stats: Optional[Dict[str, int]] = None) -> List[List[Box]]:
+    """
+    Boxes for the `steps` frames strictly between two keyframes. Matched boxes (overlapping,
+    or moving at most max_speed box sizes per frame) move linearly. Same-label boxes still
+    unmatched are paired nearest first and the hull spanning both is blurred for the whole
+    gap, so a fast object is never left uncovered; any other unmatched box is kept for the
+    whole gap (an object leaving or entering is blurred rather than missed). nxt=None (end
+    of video) holds prev. Every propagated box is padded by `margin`.
+
+    stats, if given, counts pairs matched by overlap ("iou") and by distance ("jump"),
+    hulls ("hull") and boxes held in place ("held").
+    """
+    if nxt is None:
+        held = [pad_box(e["bbox"], margin) for e in prev]
+        if stats is not None:
+            stats["held"] = stats.get("held", 0) + len(held)
+        return [list(held) for _ in range(steps)]
+    pairs, lost, new = match(prev, nxt, max_speed * (steps + 1))
+    far, lost_left, new_left = match([prev[i] for i in lost], [nxt[j] for j in new], math.inf)
+    fixed = ([hull(prev[lost[a]]["bbox"], nxt[new[b]]["bbox"]) for a, b in far]
+             + [prev[lost[a]]["bbox"] for a in lost_left] + [nxt[new[b]]["bbox"] for b in new_left])
+    if stats is not None:
+        n_iou = sum(iou(prev[i]["bbox"], nxt[j]["bbox"]) > 0 for i, j in pairs)
+        for k, v in (("iou", n_iou), ("jump", len(pairs) - n_iou), ("hull", len(far)),
+                     ("held", len(lost_left) + len(new_left))):
+            stats[k] = stats.get(k, 0) + v
+    out = []
+    for k in range(1, steps + 1):
+        t = k / (steps + 1)
+        moving = [[a + (b - a) * t for a, b in zip(prev[i]["bbox"], nxt[j]["bbox"])] for i, j in pairs]
+        out.append([pad_box(b, margin) for b in moving + fixed])
+    return out
+
+def _thumb(frame: np.ndarray) -> np.ndarray:
+    return cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (32, 18), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+def propagate(
+    frames: Iterable[np.ndarray],
+    detect: Callable[[np.ndarray], List[Entity]],
+    interval: int,
+    margin: float,
+    scene_threshold: float,
+    max_speed: float = 0.0,
+    stats: Optional[Dict[str, int]] = None,
+) -> Iterator[Tuple[np.ndarray, List[Box]]]:
+    """
+    Yields (frame, boxes) for every input frame, in order, calling `detect` only on
+    keyframes: every `interval`-th frame, plus any frame whose 32x18 grey thumbnail differs
+    from the last keyframe's by more than `scene_threshold` (mean abs, 0-255). Frames in
+    between are buffered until the next keyframe so their boxes can be interpolated
+    (see interpolate for max_speed and stats).
+    """
+    interval = max(1, interval)
+    key_ents: Optional[List[Entity]] = None
+    key_thumb = None
+    pending: List[np.ndarray] = []
+    since_key = 0
+    for frame in frames:
+        thumb = _thumb(frame) if scene_threshold > 0 else None
+        is_key = (key_ents is None or since_key >= interval
+                  or (thumb is not None and np.abs(thumb - key_thumb).mean() > scene_threshold))
+        if not is_key:
+            pending.append(frame)
+            since_key += 1
+            continue
+        ents = detect(frame)
+        if pending:
+            for f, boxes in zip(pending, interpolate(key_ents, ents, len(pending), margin, max_speed, stats)):
+                yield f, boxes
+            pending = []
+        yield frame, [e["bbox"] for e in ents]
+        key_ents, key_thumb, since_key = ents, thumb, 1
+    if pending:
+        for f, boxes in zip(pending, interpolate(key_ents, None, len(pending), margin, max_speed, stats)):
+            yield f, boxes
@@ -1,111 +1,387 @@
 # prismguard_vision/wrapper.py
 from pathlib import Path
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Callable, Iterator, Tuple, List, Optional
 from PIL import Image
-import tempfile, shutil, subprocess, yaml, glob, os
+import io, glob, queue, shutil, subprocess, tempfile, threading, os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+
+from .backends import check_backend, resolve_backend
+from .detector import DetectorPool
+from .obfuscate import obfuscate
+from .profiles import DetectProfile, detect_images
+from .tracking import propagate
 
 ROOT = Path(__file__).resolve().parents[1]
 DASHCAM = ROOT / "prismguard_vision" / "dashcam_anonymizer"
-MODEL_PATH = DASHCAM / "model" / "best.pt"
+MODEL_PATH = Path(os.getenv("VISION_MODEL_PATH", str(DASHCAM / "model" / "best.pt")))
+
+DETECTION_CONF = float(os.getenv("DETECTION_CONF", "0.35"))
+# obfuscation strength (kernel size in px); the method is OBFUSCATION_METHOD, see obfuscate.py
+IMG_BLUR_RADIUS = int(os.getenv("IMG_BLUR_RADIUS", "51"))
+VID_BLUR_RADIUS = int(os.getenv("VID_BLUR_RADIUS", "15"))
+# parallel requests: one resident detector per worker
+VISION_WORKERS = int(os.getenv("VISION_WORKERS", str(min(4, os.cpu_count() or 1))))
+# frames per forward pass in anonymize_images
+VISION_BATCH_SIZE = int(os.getenv("VISION_BATCH_SIZE", "8"))
+# frames buffered between the decode -> detect -> encode stages of anonymize_video
+VIDEO_QUEUE_FRAMES = int(os.getenv("VIDEO_QUEUE_FRAMES", "32"))
+# keyframe mode: detect every N frames (and on scene cuts), interpolate boxes in between.
+# 1 runs the detector on every frame.
+VIDEO_KEYFRAME_INTERVAL = int(os.getenv("VIDEO_KEYFRAME_INTERVAL", "1"))
+VIDEO_BOX_MARGIN = float(os.getenv("VIDEO_BOX_MARGIN", "0.15"))  # padding on propagated boxes, fraction of size
+VIDEO_SCENE_THRESHOLD = float(os.getenv("VIDEO_SCENE_THRESHOLD", "30"))  # mean abs thumbnail diff forcing a keyframe
+VIDEO_MAX_SPEED = float(os.getenv("VIDEO_MAX_SPEED", "1.5"))  # box sizes/frame a tracked object may move between keyframes
+# long videos are cut at keyframes into ~VIDEO_SEGMENT_SECONDS pieces and processed by this
+# many worker processes (each with its own detector); 1 disables segmenting
+VIDEO_SEGMENT_WORKERS = int(os.getenv("VIDEO_SEGMENT_WORKERS", str(min(4, os.cpu_count() or 1))))
+VIDEO_SEGMENT_SECONDS = float(os.getenv("VIDEO_SEGMENT_SECONDS", "10"))
 
 if not os.path.exists(MODEL_PATH):
     raise FileNotFoundError(f"Model not found at {MODEL_PATH}")
 
-def _latest_labels_dir(prefix: str) -> str:
-    # Handles Ultralytics auto-incremented runs dirs (yolo_images_pred2, etc.)
-    candidates = glob.glob(f"runs/detect/{prefix}*")
-    if not candidates:
-        return f"runs/detect/{prefix}/labels/"
-    return os.path.join(max(candidates, key=os.path.getmtime), "labels")
-
-def anonymize_image(pil_img: Image.Image) -> Dict[str, Any]:
-    work = Path(tempfile.mkdtemp(prefix="pg_img_"))
-    in_dir = work / "in"; out_dir = work / "out"
-    in_dir.mkdir(parents=True, exist_ok=True)
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    inp = in_dir / "image.png"
-    pil_img.save(inp)
-    w, h = pil_img.size
-
-    cfg = {
-        "model_path": str(MODEL_PATH),
-        "images_path": str(in_dir),
-        "output_folder": str(out_dir),
-        "img_format": ".png",
-        "img_width": w,
-        "img_height": h,
-        "detection_conf_thresh": 0.35,
-        "gpu_avail": False,
-        "blur_radius": 51,
-    }
-    cfg_path = work / "img_cfg.yaml"
-    cfg_path.write_text(yaml.safe_dump(cfg))
-
-    # Clean vendor temp dirs so Ultralytics uses yolo_images_pred (not yolo_images_pred2/3/…)
-    subprocess.run(
-        [
-            "python", "-c",
-            "import shutil,glob,os;"
-            "shutil.rmtree('annot_txt', ignore_errors=True);"
-            "[shutil.rmtree(p, ignore_errors=True) for p in glob.glob('runs/detect/yolo_images_pred*')];"
-            "os.makedirs('annot_txt', exist_ok=True)"
-        ],
-        check=True, cwd=str(DASHCAM)
-    )
-
-    # Run vendor script
-    subprocess.run(["python", "blur_images.py", "--config", str(cfg_path)], check=True, cwd=str(DASHCAM))
-
-    # Try to find a produced image; if none, fall back to original
-    out_img = next(out_dir.rglob("*.jpg"), None) or next(out_dir.rglob("*.png"), None)
-    if out_img:
-        red = Image.open(out_img).convert("RGB")
-    else:
-        red = pil_img.copy()  # no detections -> return original
-
-    # Collect entities if any
-    entities = []
-    ann = DASHCAM / "annot_txt"
-    if ann.exists():
-        for t in ann.glob("*.txt"):
-            for line in t.read_text().strip().splitlines():
-                parts = line.split()
-                if len(parts) >= 4:
-                    x1, y1, x2, y2 = map(float, parts[:4])
-                    entities.append({"label": "object", "bbox": [x1, y1, x2, y2], "conf": 1.0})
-
-    return {"image": red, "entities": entities}
-
-def anonymize_video(video_path: str) -> Tuple[str, dict]:
-    work = Path(tempfile.mkdtemp(prefix="pg_vid_"))
-    in_dir = work / "in"; out_dir = work / "out"
-    in_dir.mkdir(parents=True, exist_ok=True)
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    local = in_dir / Path(video_path).name
-    shutil.copy2(video_path, local)
-
-    cfg = {
-        "model_path": str(MODEL_PATH),
-        "videos_path": str(in_dir),
-        "output_folder": str(out_dir),
-        "generate_detections": True,
-        "generate_jsons": True,
-        "detection_conf_thresh": 0.35,
-        "gpu_avail": False,
-        "blur_radius": 15,
-    }
-    cfg_path = work / "vid_cfg.yaml"
-    cfg_path.write_text(yaml.safe_dump(cfg))
-
-    # Run vendor script
-    subprocess.run(
-        ["python", "blur_videos.py", "--config", str(cfg_path)],
-        check=True, cwd=str(DASHCAM)
-    )
-
-    out_vid = next(out_dir.rglob("*.mp4"), None)
-    if not out_vid:
-        raise FileNotFoundError("No redacted video produced by dashcam_anonymizer")
-    return str(out_vid), {"entities": []}
+# torch | onnx | onnx-int8 | openvino | auto (fastest installed, timed at startup); exports
+# are built on first use and cached next to the weights
+VISION_BACKEND = check_backend(os.getenv("VISION_BACKEND", "auto"))
+
+# Detectors are loaded once (app startup calls get_pool) and stay resident;
+# the dashcam_anonymizer scripts remain usable as standalone CLIs.
+_pool: Optional[DetectorPool] = None
+_pool_lock = threading.Lock()
+
+_backend: Optional[Tuple[str, Path]] = None
+
+def detector_backend() -> Tuple[str, Path]:
+    """
+    (backend name, artifact path) the detectors load; resolved (and exported) once.
+    """
+    global _backend
+    if _backend is None:
+        _backend = resolve_backend(VISION_BACKEND, MODEL_PATH)
+    return _backend
+
+def detector_path() -> Path:
+    return detector_backend()[1]
+
+def get_pool() -> DetectorPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = DetectorPool(detector_path(), conf=DETECTION_CONF, size=VISION_WORKERS)
+    return _pool
+
+def decode_image(data: bytes) -> np.ndarray:
+    """
+    Encoded bytes -> BGR array, entirely in memory. Formats OpenCV can't decode
+    (e.g. GIF) go through PIL. Raises ValueError for corrupt/unsupported input.
+    """
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is not None:
+        return img
+    try:
+        rgb = np.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+    except Exception:
+        raise ValueError("Unsupported or corrupt image")
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+def encode_image(image: np.ndarray, ext: str = ".png", params: Tuple[int, ...] = ()) -> bytes:
+    ok, buf = cv2.imencode(ext, image, list(params))
+    if not ok:
+        raise ValueError(f"Could not encode image as {ext}")
+    return buf.tobytes()
+
+# output format name -> (extension, media type)
+CODECS = {"png": (".png", "image/png"), "jpeg": (".jpg", "image/jpeg"), "webp": (".webp", "image/webp")}
+OUTPUT_QUALITY = int(os.getenv("OUTPUT_QUALITY", "90"))  # JPEG/WebP, 1-100
+OUTPUT_PNG_LEVEL = int(os.getenv("OUTPUT_PNG_LEVEL", "-1"))  # zlib level 0-9; -1 = OpenCV's fast default
+
+def sniff_format(data: bytes) -> str:
+    """
+    Output format matching the uploaded bytes; anything but JPEG/WebP comes back as PNG.
+    """
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "png"
+
+class Codec:
+    """
+    A resolved output encoding. tag identifies it in the result cache.
+    """
+
+    def __init__(self, fmt: str, quality: Optional[int] = None, png_level: Optional[int] = None):
+        if fmt not in CODECS:
+            raise ValueError(f"Unknown output format {fmt!r}; expected one of {', '.join(CODECS)}")
+        self.fmt = fmt
+        self.ext, self.media_type = CODECS[fmt]
+        if fmt == "png":
+            level = OUTPUT_PNG_LEVEL if png_level is None else png_level
+            self.params = (cv2.IMWRITE_PNG_COMPRESSION, min(9, level)) if level >= 0 else ()
+        else:
+            q = min(100, max(1, OUTPUT_QUALITY if quality is None else quality))
+            flag = cv2.IMWRITE_JPEG_QUALITY if fmt == "jpeg" else cv2.IMWRITE_WEBP_QUALITY
+            self.params = (flag, q)
+        self.tag = f"{self.ext}:{self.params[1] if self.params else 'default'}"
+
+    def encode(self, image: np.ndarray) -> bytes:
+        return encode_image(image, self.ext, self.params)
+
+def anonymize_image(image: np.ndarray, profile: Optional[DetectProfile] = None) -> Dict[str, Any]:
+    """
+    Detect and blur in place on a BGR array; no filesystem access and no shared
+    state, so any number of calls can run in parallel (bounded by the detector pool).
+    Returns the same array (blurred) and the detected entities.
+    """
+    return anonymize_images([image], profile)[0]
+
+def anonymize_images(images: List[np.ndarray], profile: Optional[DetectProfile] = None) -> List[Dict[str, Any]]:
+    """
+    Batched anonymize_image: frames go through the detector VISION_BATCH_SIZE at a time
+    under a single lease (see profiles.py for how each profile feeds it), then each is
+    blurred in place. Results are in input order.
+    """
+    with get_pool().lease() as det:
+        entities = detect_images(det, images, profile or DetectProfile(), VISION_BATCH_SIZE)
+    for img, ents in zip(images, entities):
+        if ents:
+            obfuscate(img, [e["bbox"] for e in ents], IMG_BLUR_RADIUS)
+    return [{"image": img, "entities": ents} for img, ents in zip(images, entities)]
+
+_EOS = object()  # end-of-stream marker passed down the video pipeline
+
+def _put(q: "queue.Queue", item, stop: threading.Event) -> bool:
+    # bounded put that gives up once another stage has failed
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q: "queue.Queue", stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _EOS
+
+def _drain(q: "queue.Queue", stop: threading.Event) -> Iterator[np.ndarray]:
+    while True:
+        item = _get(q, stop)
+        if item is _EOS:
+            return
+        yield item
+
+def _detect_all(q: "queue.Queue", stop: threading.Event, detector) -> Iterator[Tuple[np.ndarray, List[List[float]]]]:
+    # every frame through the detector; whatever is already decoded (up to a batch) goes
+    # through in one forward pass
+    done = False
+    while not done:
+        batch = [_get(q, stop)]
+        while len(batch) < VISION_BATCH_SIZE and batch[-1] is not _EOS:
+            try:
+                batch.append(q.get_nowait())
+            except queue.Empty:
+                break
+        if batch[-1] is _EOS:
+            batch.pop()
+            done = True
+        for frame, ents in zip(batch, detector.detect_batch(batch)):
+            yield frame, [e["bbox"] for e in ents]
+
+def _video_info(video_path: str) -> Tuple[int, float]:
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video {video_path}")
+        return max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))), cap.get(cv2.CAP_PROP_FPS) or 25.0
+    finally:
+        cap.release()
+
+def _ffmpeg(*args: str):
+    subprocess.run(["ffmpeg", "-nostdin", "-v", "error", "-y", *args], check=True)
+
+def _split(video_path: str, seg_dir: str) -> List[str]:
+    # stream copy, so cuts can only land on keyframes and every segment decodes on its own
+    _ffmpeg("-i", video_path, "-map", "0:v:0", "-c", "copy", "-f", "segment",
+            "-segment_time", str(VIDEO_SEGMENT_SECONDS), "-reset_timestamps", "1",
+            os.path.join(seg_dir, "seg%05d.mp4"))
+    return sorted(glob.glob(os.path.join(seg_dir, "seg*.mp4")))
+
+def _concat(parts: List[str], out_path: str):
+    listing = out_path + ".txt"
+    with open(listing, "w") as f:
+        f.writelines(f"file '{p}'\n" for p in parts)
+    try:
+        _ffmpeg("-f", "concat", "-safe", "0", "-i", listing, "-c", "copy", out_path)
+    finally:
+        os.remove(listing)
+
+_segment_pool: Optional[ProcessPoolExecutor] = None
+
+def _segment_worker_init(workers: int, backend: Tuple[str, Path]):
+    import torch
+
+    global _pool, _backend
+    _backend = backend  # reuse the parent's choice instead of re-timing "auto" per worker
+    _pool = DetectorPool(detector_path(), conf=DETECTION_CONF, size=1)
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+
+def _segment_task(seg_path: str, out_dir: str) -> Tuple[str, int]:
+    out_path, meta = _anonymize_video_pass(seg_path, out_dir)
+    return out_path, meta["frames"]
+
+def _get_segment_pool() -> ProcessPoolExecutor:
+    global _segment_pool
+    with _pool_lock:
+        if _segment_pool is None:
+            # spawn: forking a process that already runs torch/OpenCV threads can deadlock
+            _segment_pool = ProcessPoolExecutor(
+                max_workers=VIDEO_SEGMENT_WORKERS, mp_context=mp.get_context("spawn"),
+                initializer=_segment_worker_init, initargs=(VIDEO_SEGMENT_WORKERS, detector_backend()),
+            )
+    return _segment_pool
+
+def shutdown_segment_pool():
+    global _segment_pool
+    if _segment_pool is not None:
+        _segment_pool.shutdown(wait=False, cancel_futures=True)
+        _segment_pool = None
+
+def anonymize_video(
+    video_path: str,
+    out_dir: Optional[str] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[str, dict]:
+    """
+    Anonymize a video file. Videos longer than two segments are cut at keyframes and the
+    segments run in parallel on the segment process pool, then are concatenated back in
+    order (progress is then reported per finished segment). Short videos, VIDEO_SEGMENT_WORKERS=1
+    or a missing ffmpeg binary take the single-process pipeline.
+    """
+    total, fps = _video_info(video_path)
+    if (VIDEO_SEGMENT_WORKERS <= 1 or shutil.which("ffmpeg") is None
+            or total < 2 * VIDEO_SEGMENT_SECONDS * fps):
+        return _anonymize_video_pass(video_path, out_dir, progress)
+
+    out_dir = Path(out_dir) if out_dir else Path(tempfile.mkdtemp(prefix="pg_vid_"))
+    out_vid = out_dir / (Path(video_path).stem + ".mp4")
+    work = tempfile.mkdtemp(prefix="pg_seg_", dir=out_dir)
+    try:
+        seg_in, seg_out = os.path.join(work, "in"), os.path.join(work, "out")
+        os.makedirs(seg_in)
+        os.makedirs(seg_out)
+        segments = _split(video_path, seg_in)
+        pool = _get_segment_pool()
+        futures = {pool.submit(_segment_task, seg, seg_out): i for i, seg in enumerate(segments)}
+        parts: List[Optional[str]] = [None] * len(segments)
+        frames = 0
+        for fut in as_completed(futures):
+            parts[futures[fut]], n = fut.result()
+            frames += n
+            if progress is not None:
+                progress(frames, max(total, frames))
+        _concat(parts, str(out_vid))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return str(out_vid), {"entities": [], "frames": frames, "segments": len(segments)}
+
+def _anonymize_video_pass(
+    video_path: str,
+    out_dir: Optional[str] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[str, dict]:
+    """
+    Single pass over the video: a decode thread, detection on the calling thread and an
+    encode thread, joined by bounded frame queues so the three overlap. Detections never
+    leave memory. Whichever stage fails first stops the others and its error is re-raised.
+    The output goes to out_dir (a fresh temp dir by default); progress(frames_done,
+    frames_total) is called from the encode thread after every frame.
+    """
+    out_dir = Path(out_dir) if out_dir else Path(tempfile.mkdtemp(prefix="pg_vid_"))
+    out_vid = out_dir / (Path(video_path).stem + ".mp4")
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video {video_path}")
+    fw, fh = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = round(cap.get(cv2.CAP_PROP_FPS)) or 25
+    total = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))  # container estimate, may be 0
+    writer = cv2.VideoWriter(str(out_vid), cv2.VideoWriter_fourcc(*"avc1"), fps, (fw, fh))
+    if not writer.isOpened():  # OpenCV builds without H.264
+        writer = cv2.VideoWriter(str(out_vid), cv2.VideoWriter_fourcc(*"mp4v"), fps, (fw, fh))
+
+    decoded: "queue.Queue" = queue.Queue(maxsize=VIDEO_QUEUE_FRAMES)
+    detected: "queue.Queue" = queue.Queue(maxsize=VIDEO_QUEUE_FRAMES)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+    frames = keyframes = 0
+
+    def decode():
+        try:
+            while not stop.is_set():
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                if not _put(decoded, frame, stop):
+                    return
+            _put(decoded, _EOS, stop)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    def encode():
+        nonlocal frames
+        try:
+            while True:
+                item = _get(detected, stop)
+                if item is _EOS:
+                    return
+                frame, boxes = item
+                writer.write(obfuscate(frame, boxes, VID_BLUR_RADIUS))
+                frames += 1
+                if progress is not None:
+                    progress(frames, max(total, frames))
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=decode, name="pg-vid-decode", daemon=True),
+               threading.Thread(target=encode, name="pg-vid-encode", daemon=True)]
+    for t in threads:
+        t.start()
+    try:
+        with get_pool().lease() as detector:
+            if VIDEO_KEYFRAME_INTERVAL > 1:
+                def detect_key(frame):
+                    nonlocal keyframes
+                    keyframes += 1
+                    return detector.detect(frame)
+
+                boxed = propagate(_drain(decoded, stop), detect_key, VIDEO_KEYFRAME_INTERVAL,
+                                  VIDEO_BOX_MARGIN, VIDEO_SCENE_THRESHOLD, VIDEO_MAX_SPEED)
+            else:
+                boxed = _detect_all(decoded, stop, detector)
+            for item in boxed:
+                if not _put(detected, item, stop):
+                    break
+        _put(detected, _EOS, stop)
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        for t in threads:
+            t.join()
+        cap.release()
+        writer.release()
+
+    if errors:
+        raise errors[0]
+    return str(out_vid), {"entities": [], "frames": frames,
+                          "keyframes": keyframes if VIDEO_KEYFRAME_INTERVAL > 1 else frames}
@@ -1,10 +1,12 @@
-import os, base64, uuid, json, time, collections
+import os, base64, uuid, json, time, collections, importlib.util, tempfile
 import httpx
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional, Literal
 from pydantic import BaseModel
 import time
+from audit import AuditBuffer
 
 
 # ---- config
@@ -14,6 +16,28 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "prismguard-redacted")
 
+# upstream connection pools (one long-lived client per upstream, see lifespan)
+HTTP_MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))  # per upstream
+HTTP_MAX_KEEPALIVE = int(os.getenv("GATEWAY_MAX_KEEPALIVE", "20"))  # idle connections kept open per upstream
+HTTP_KEEPALIVE_S = float(os.getenv("GATEWAY_KEEPALIVE_S", "60"))  # idle connection lifetime
+HTTP_CONNECT_TIMEOUT_S = float(os.getenv("GATEWAY_CONNECT_TIMEOUT_S", "5"))
+HTTP_POOL_TIMEOUT_S = float(os.getenv("GATEWAY_POOL_TIMEOUT_S", "10"))  # wait for a free connection
+# HTTP/2 for the TLS upstreams (Supabase); needs the h2 package (httpx[http2])
+HTTP2 = os.getenv("GATEWAY_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+VISION_TIMEOUT_S = float(os.getenv("VISION_TIMEOUT_S", "120"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+SUPABASE_REST_TIMEOUT_S = float(os.getenv("SUPABASE_REST_TIMEOUT_S", "10"))
+SUPABASE_STORAGE_TIMEOUT_S = float(os.getenv("SUPABASE_STORAGE_TIMEOUT_S", "30"))
+
+# audit log: rows are queued and bulk-inserted in the background (see audit.AuditBuffer)
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))  # rows per insert; a full batch flushes early
+AUDIT_FLUSH_INTERVAL_S = float(os.getenv("AUDIT_FLUSH_INTERVAL_S", "2"))
+AUDIT_MAX_PENDING = int(os.getenv("AUDIT_MAX_PENDING", "10000"))  # in memory; beyond this rows go to disk
+AUDIT_MAX_BACKOFF_S = float(os.getenv("AUDIT_MAX_BACKOFF_S", "60"))
+AUDIT_SHUTDOWN_TIMEOUT_S = float(os.getenv("AUDIT_SHUTDOWN_TIMEOUT_S", "5"))
+# spilled/unsent rows survive restarts here; mount a volume to keep them across redeploys
+AUDIT_SPILL_DIR = os.getenv("AUDIT_SPILL_DIR", os.path.join(tempfile.gettempdir(), "pg_gateway_audit"))
+
 # Firebase admin 
 VERIFY_TOKENS = True if os.getenv("FIREBASE_ADMIN_CREDENTIALS_FILE") else False
 if VERIFY_TOKENS:
@@ -22,7 +46,44 @@ if VERIFY_TOKENS:
     cred = credentials.Certificate(os.getenv("FIREBASE_ADMIN_CREDENTIALS_FILE"))
     firebase_admin.initialize_app(cred)
 
-app = FastAPI(title="PrismGuard Gateway", version="0.1.0")
+_clients: dict[str, httpx.AsyncClient] = {}
+
+def _client(base_url: str, timeout_s: float, http2: bool = False, headers: dict | None = None) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        http2=http2,
+        timeout=httpx.Timeout(timeout_s, connect=HTTP_CONNECT_TIMEOUT_S, pool=HTTP_POOL_TIMEOUT_S),
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                            keepalive_expiry=HTTP_KEEPALIVE_S),
+    )
+
+def upstream(name: str) -> httpx.AsyncClient:
+    """
+    The shared client for vision | llm | supabase_rest | supabase_storage.
+    """
+    return _clients[name]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # internal services speak plain HTTP/1.1 (no h2c); Supabase is TLS, where HTTP/2 pays off
+    if VISION_URL:
+        _clients["vision"] = _client(VISION_URL, VISION_TIMEOUT_S)
+    if LLM_URL:
+        _clients["llm"] = _client(LLM_URL, LLM_TIMEOUT_S)
+    if SUPABASE_URL and SUPABASE_KEY:
+        auth = {"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"}
+        _clients["supabase_rest"] = _client(f"{SUPABASE_URL}/rest/v1", SUPABASE_REST_TIMEOUT_S, HTTP2, auth)
+        _clients["supabase_storage"] = _client(f"{SUPABASE_URL}/storage/v1", SUPABASE_STORAGE_TIMEOUT_S, HTTP2, auth)
+        _audit.start()  # replays rows spilled by a previous run first
+    yield
+    await _audit.stop(AUDIT_SHUTDOWN_TIMEOUT_S)  # before the clients it sends through are closed
+    for cli in _clients.values():
+        await cli.aclose()
+    _clients.clear()
+
+app = FastAPI(title="PrismGuard Gateway", version="0.1.0", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
 async def verify_auth(authorization: str | None) -> str | None:
@@ -41,7 +102,18 @@ async def verify_auth(authorization: str | None) -> str | None:
     except Exception as e:
         raise HTTPException(401, f"Invalid token: {e}")
 
-async def supabase_insert_audit(uid: str | None, event_type: str, entities: list, timing_ms: float):
+async def supabase_insert_audit(rows: list):
+    # one PostgREST bulk insert for the whole batch
+    r = await upstream("supabase_rest").post("/audit_logs", headers={"Prefer": "return=minimal"}, json=rows)
+    r.raise_for_status()
+
+_audit = AuditBuffer(supabase_insert_audit, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL_S,
+                     AUDIT_MAX_PENDING, AUDIT_SPILL_DIR, AUDIT_MAX_BACKOFF_S)
+
+def record_audit(uid: str | None, event_type: str, entities: list, timing_ms: float):
+    """
+    Queue an audit row; it is written to Supabase in the background, off the request path.
+    """
     if not (SUPABASE_URL and SUPABASE_KEY):
         return
     # build simple histogram by label
@@ -53,67 +125,79 @@ async def supabase_insert_audit(uid: str | None, event_type: str, entities: list
         "timing_ms": timing_ms,
         "version": "gateway-0.1.0",
     }
-    async with httpx.AsyncClient(timeout=10) as cli:
-        r = await cli.post(f"{SUPABASE_URL}/rest/v1/audit_logs",
-            headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}",
-                     "Content-Type": "application/json", "Prefer": "return=minimal"},
-            json=payload)
-        r.raise_for_status()
-
-async def supabase_upload_png(uid: str, b64: str) -> str | None:
-    import base64, uuid, httpx, os
+    _audit.add(payload)
+
+IMAGE_EXT = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+
+async def supabase_upload_image(uid: str, data: bytes, media_type: str = "image/png") -> str | None:
     if not (SUPABASE_URL and SUPABASE_KEY and SUPABASE_BUCKET):
         return None
-    key = f"{uid}/images/{uuid.uuid4().hex}.png"
-    data = base64.b64decode(b64)
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-    }
-    async with httpx.AsyncClient(timeout=30) as cli:
-        up = await cli.post(
-            f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET}/{key}",
-            headers={**headers, "Content-Type": "image/png", "x-upsert": "true"},
-            content=data,
-        )
-        up.raise_for_status()
-        sign = await cli.post(
-            f"{SUPABASE_URL}/storage/v1/object/sign/{SUPABASE_BUCKET}/{key}",
-            headers=headers,
-            json={"expiresIn": 3600},
-        )
-        sign.raise_for_status()
-        signed_path = sign.json().get("signedURL")
-        return f"{SUPABASE_URL}/storage/v1/{signed_path}"
+    key = f"{uid}/images/{uuid.uuid4().hex}.{IMAGE_EXT.get(media_type, 'png')}"
+    cli = upstream("supabase_storage")
+    up = await cli.post(
+        f"/object/{SUPABASE_BUCKET}/{key}",
+        headers={"Content-Type": media_type, "x-upsert": "true"},
+        content=data,
+    )
+    up.raise_for_status()
+    sign = await cli.post(
+        f"/object/sign/{SUPABASE_BUCKET}/{key}",
+        json={"expiresIn": 3600},
+    )
+    sign.raise_for_status()
+    signed_path = sign.json().get("signedURL")
+    return f"{SUPABASE_URL}/storage/v1/{signed_path}"
+
+def split_vision_multipart(content_type: str, body: bytes) -> tuple[dict, bytes, str]:
+    """
+    (metadata, image bytes, image media type) from vision's multipart/mixed image response.
+    """
+    ctype, _, params = content_type.partition(";")
+    boundary = dict(p.strip().split("=", 1) for p in params.split(";") if "=" in p).get("boundary", "").strip('"')
+    if ctype.strip() != "multipart/mixed" or not boundary:
+        raise ValueError(f"expected multipart/mixed, got {content_type!r}")
+    parts = []
+    for chunk in body.split(b"--" + boundary.encode())[1:-1]:
+        head, _, payload = chunk[2:].partition(b"\r\n\r\n")  # skip the CRLF after the delimiter
+        headers = dict(line.split(": ", 1) for line in head.decode("latin-1").split("\r\n") if ": " in line)
+        parts.append((headers.get("Content-Type", ""), payload[:-2]))  # drop the CRLF before the next one
+    if len(parts) != 2:
+        raise ValueError(f"expected 2 parts, got {len(parts)}")
+    (_, meta), (media_type, image) = parts
+    return json.loads(meta), image, media_type
 
 @app.get("/health")
-def health(): return {"ok": True}
+def health(): return {"ok": True, "audit": _audit.stats()}
 
 @app.post("/v1/gateway/image")
 async def gateway_image(authorization: str | None = Header(None), file: UploadFile = File(...)):
     uid = await verify_auth(authorization)
     t0 = time.time()
-    async with httpx.AsyncClient(timeout=120) as cli:
-        files = {"file": (file.filename, await file.read(), file.content_type or "image/png")}
-        vr = await cli.post(f"{VISION_URL}/v1/anonymize/image", files=files)
-        if vr.status_code != 200:
-            raise HTTPException(502, f"Vision error: {vr.text}")
-        data = vr.json()
-    timing_ms = data.get("timing_ms", (time.time()-t0)*1000.0)
+    files = {"file": (file.filename, await file.read(), file.content_type or "image/png")}
+    # JSON part (entities, timing) + raw image part in the upload's own format; entities stay
+    # in the body, so crowded frames can't overflow header limits
+    vr = await upstream("vision").post("/v1/anonymize/image", files=files,
+                                       headers={"Accept": "multipart/mixed"})
+    if vr.status_code != 200:
+        raise HTTPException(502, f"Vision error: {vr.text}")
+    try:
+        meta, redacted, media_type = split_vision_multipart(vr.headers.get("content-type", ""), vr.content)
+    except ValueError as e:
+        raise HTTPException(502, f"Vision error: {e}")
+    entities = meta.get("entities", [])
+    timing_ms = float(meta.get("timing_ms", (time.time()-t0)*1000.0))
     # optional: upload redacted artifact
     url = None
-    if data.get("redacted_image_b64") and uid:
+    if redacted and uid:
         try:
-            url = await supabase_upload_png(uid, data["redacted_image_b64"])
+            url = await supabase_upload_image(uid, redacted, media_type)
         except Exception:
             url = None
-    try:
-        await supabase_insert_audit(uid, "image", data.get("entities", []), timing_ms)
-    except Exception:
-        pass
+    record_audit(uid, "image", entities, timing_ms)
     return {
-        "redacted_image_b64": data.get("redacted_image_b64"),
-        "entities": data.get("entities", []),
+        "redacted_image_b64": base64.b64encode(redacted).decode(),
+        "media_type": media_type,
+        "entities": entities,
         "timing_ms": timing_ms,
         "storage_url": url,
         "attestation": "v1",
@@ -142,28 +226,15 @@ async def gateway_text(
             "timing_ms": 0.0,
             "attestation": "v1",
         }
-        try:
-            await supabase_insert_audit(uid, "text", [], 0.0)
-        except Exception:
-            pass
+        record_audit(uid, "text", [], 0.0)
         return data
 
     t0 = time.time()
-    async with httpx.AsyncClient(timeout=60) as cli:
-        resp = await cli.post(f"{LLM_URL}/v1/anonymize/text", json=req.model_dump())
-        resp.raise_for_status()
-        data = resp.json()
+    resp = await upstream("llm").post("/v1/anonymize/text", json=req.model_dump())
+    resp.raise_for_status()
+    data = resp.json()
 
-    # Best-effort audit log
-    try:
-        await supabase_insert_audit(
-            uid,
-            "text",
-            data.get("entities", []),
-            data.get("timing_ms", (time.time() - t0) * 1000.0),
-        )
-    except Exception:
-        pass
+    record_audit(uid, "text", data.get("entities", []), data.get("timing_ms", (time.time() - t0) * 1000.0))
 
     data["attestation"] = "v1"
     return data
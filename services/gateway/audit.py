@@ -0,0 +1,217 @@
+import os, json, time, asyncio, logging
+from collections import deque
+from itertools import islice
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+Rows = List[Dict]
+
+log = logging.getLogger("prismguard.gateway.audit")
+
+# 4xx answers worth retrying; any other 4xx means the rows themselves were refused
+_RETRYABLE = {408, 425, 429}
+
+class AuditBuffer:
+    """
+    Write-behind audit log. add() only queues the row; a background task sends queued rows
+    as one bulk insert once batch_size rows are waiting or interval_s has passed.
+
+    Failed inserts are retried with exponential backoff (capped at max_backoff_s), and a
+    slow insert delays the next one by as long as it took. Rows that don't fit in memory
+    (max_pending) and rows still queued at shutdown are appended to audit-spill.jsonl in
+    spill_dir, which is replayed on start and whenever Supabase is reachable again. All file
+    I/O runs in worker threads, never on the event loop.
+    Delivery is at-least-once: a replay cut short by a crash may resend rows. Rows the
+    server refuses outright (non-retryable 4xx) are kept in audit-rejected.jsonl.
+    """
+
+    def __init__(self, insert: Callable[[Rows], Awaitable[None]], batch_size: int, interval_s: float,
+                 max_pending: int, spill_dir: str, max_backoff_s: float = 60.0):
+        self.insert = insert
+        self.batch_size = max(1, batch_size)
+        self.interval_s = interval_s
+        self.max_pending = max(self.batch_size, max_pending)
+        self.max_backoff_s = max_backoff_s
+        os.makedirs(spill_dir, exist_ok=True)
+        self.spill_path = os.path.join(spill_dir, "audit-spill.jsonl")
+        self.rejected_path = os.path.join(spill_dir, "audit-rejected.jsonl")
+        self._rows: deque = deque()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._overflow: Rows = []  # rows waiting for the spill writer
+        self._writer: Optional[asyncio.Task] = None
+        self._spill_lock = asyncio.Lock()  # spill appends vs. replay's rename
+        self.last_error: Optional[str] = None
+        self._stopping = False
+        self._failures = 0
+        self._retry_at = 0.0
+        self.sent = self.spilled = self.rejected = self.failed_inserts = 0
+
+    def add(self, row: Dict):
+        if len(self._rows) >= self.max_pending:
+            self._overflow.append(row)
+            if self._writer is None or self._writer.done():
+                self._writer = asyncio.create_task(self._write_overflow())
+            return
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self._wake.set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout_s: float):
+        """
+        One last flush (bounded by timeout_s); whatever is still queued goes to the spill file.
+        """
+        self._stopping = True
+        self._wake.set()
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, timeout_s)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+        self._overflow.extend(self._rows)
+        self._rows.clear()
+        if self._writer is not None:
+            await self._writer
+        await self._write_overflow()
+
+    async def _write_overflow(self):
+        # batches whatever accumulated while the previous write was in flight
+        while self._overflow:
+            rows, self._overflow = self._overflow, []
+            async with self._spill_lock:
+                try:
+                    await asyncio.to_thread(self._append, self.spill_path, rows)
+                except OSError as e:
+                    log.error("audit spill write failed, %d rows dropped: %s", len(rows), e)
+                    self.last_error = f"spill: {e}"
+                    continue
+            self.spilled += len(rows)
+
+    async def _run(self):
+        replayed = False
+        while not self._stopping:
+            if replayed:
+                delay = max(self.interval_s, self._retry_at - time.monotonic())
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                if not self._stopping and time.monotonic() < self._retry_at:
+                    continue  # backing off: woken early by a full batch
+            try:
+                if not replayed:
+                    replayed = True
+                    await self._replay()
+                elif await self._flush() and not self._stopping:
+                    await self._replay()
+            except Exception as e:
+                # never let one bad batch or file error end auditing for the process lifetime
+                log.exception("audit flush failed")
+                self.last_error = repr(e)
+                self._backoff()
+
+    async def _flush(self) -> bool:
+        while self._rows:
+            # rows leave the queue only once sent, so a flush cut off by stop() loses nothing
+            batch = list(islice(self._rows, self.batch_size))
+            if not await self._send(batch):
+                return False
+            for _ in batch:
+                self._rows.popleft()
+        return True
+
+    async def _replay(self) -> bool:
+        """
+        Send spilled rows. The spill file is first renamed aside so rows spilled meanwhile
+        land in a fresh file; on failure the unsent remainder is written back.
+        """
+        replay = self.spill_path + ".replay"
+        while os.path.exists(replay) or os.path.exists(self.spill_path):
+            if not os.path.exists(replay):
+                async with self._spill_lock:
+                    os.replace(self.spill_path, replay)
+            rows = await asyncio.to_thread(self._read, replay)
+            for i in range(0, len(rows), self.batch_size):
+                if not await self._send(rows[i:i + self.batch_size]):
+                    await asyncio.to_thread(self._rewrite, replay, rows[i:])
+                    return False
+            os.remove(replay)
+        return True
+
+    async def _send(self, batch: Rows) -> bool:
+        t0 = time.monotonic()
+        try:
+            await self.insert(batch)
+        except httpx.HTTPStatusError as e:
+            code = e.response.status_code
+            if 400 <= code < 500 and code not in _RETRYABLE:
+                log.error("audit insert rejected (%d), %d rows kept in %s", code, len(batch), self.rejected_path)
+                await asyncio.to_thread(self._append, self.rejected_path, batch)
+                self.rejected += len(batch)
+                return True
+            self.last_error = f"HTTP {code}"
+            return self._backoff()
+        except Exception as e:
+            self.last_error = repr(e)
+            return self._backoff()
+        elapsed = time.monotonic() - t0
+        self._failures = 0
+        # pace to the server: a slow insert pushes the next one back by as long as it took
+        self._retry_at = time.monotonic() + elapsed if elapsed > self.interval_s else 0.0
+        self.sent += len(batch)
+        return True
+
+    def _backoff(self) -> bool:
+        self.failed_inserts += 1
+        self._failures += 1
+        wait = min(self.max_backoff_s, self.interval_s * 2 ** min(self._failures, 16))
+        self._retry_at = time.monotonic() + wait
+        return False
+
+    # --- spill files: one JSON row per line, append-only
+
+    @staticmethod
+    def _append(path: str, rows: Rows):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in rows))
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _read(path: str) -> Rows:
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    pass  # torn last line from a crash mid-write
+        return rows
+
+    @staticmethod
+    def _rewrite(path: str, rows: Rows):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in rows))
+        os.replace(tmp, path)
+
+    def stats(self) -> Dict:
+        spill_bytes = sum(os.path.getsize(p) for p in (self.spill_path, self.spill_path + ".replay")
+                          if os.path.exists(p))
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "last_error": self.last_error,
+            "pending": len(self._rows),
+            "overflow": len(self._overflow),
+            "sent": self.sent,
+            "spilled": self.spilled,
+            "spill_bytes": spill_bytes,
+            "rejected": self.rejected,
+            "failed_inserts": self.failed_inserts,
+            "backing_off": time.monotonic() < self._retry_at and self._failures > 0,
+        }